@@ -1,12 +1,51 @@
 from flask import Flask, request, jsonify, Response, send_from_directory
 import os
+import sqlite3
 
-from parser.extract import extract_scores
+from parser.batch import collect_pdfs, parse_many, pool_stats
+from parser.cache import result_cache
+from parser.debug_store import debug_store
+from parser.document import parse_document
+from parser.extract import DEBUG_ENCODINGS, debug_options, parse_report_with_overlay
+from parser import jobs, metrics
 
 app = Flask(__name__)
 
 API_KEY = os.environ.get("API_KEY", "ithrive_secure_2026_key")
 
+# Accepted per-request detection dpi
+MIN_DPI = 50
+MAX_DPI = 300
+
+metrics.register_gauges(
+    "cache",
+    result_cache.stats,
+    counters=("memory_hits", "disk_hits", "misses", "stores",
+              "memory_evictions", "disk_evictions"),
+    shared=("disk_bytes",)
+)
+metrics.register_gauges(
+    "debug_store",
+    debug_store.stats,
+    counters=("stores", "hits", "misses", "expired", "evictions"),
+    shared=("bytes",)
+)
+metrics.register_gauges("batch_pool", pool_stats)
+metrics.register_gauges(
+    "jobs",
+    jobs.queue_depth,
+    shared=("queued", "running", "done", "failed")
+)
+
+
+def authorized():
+    auth = request.headers.get("Authorization", "")
+    return auth == f"Bearer {API_KEY}"
+
+
+def job_queue_unavailable(e):
+    return jsonify({"error": "job_queue_unavailable", "message": str(e)}), 503
+
 
 @app.route("/")
 def root():
@@ -18,16 +57,44 @@ def docs():
     return send_from_directory("static", "docs.html")
 
 
-@app.route("/debug-crop")
-def debug_crop():
-    return send_from_directory("/tmp", "debug_crop.png")
+@app.route("/debug/<artifact_id>")
+def debug_artifact(artifact_id):
+
+    if not authorized():
+        return jsonify({"error": "unauthorized"}), 401
+
+    artifact = debug_store.get(artifact_id)
+
+    if artifact is None:
+        return jsonify({"error": "not_found"}), 404
+
+    data, mimetype = artifact
+
+    response = Response(data, mimetype=mimetype)
+    # content-addressed: an id never changes what it points to
+    response.headers["Cache-Control"] = "private, max-age=86400, immutable"
+
+    return response
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    # summed over all workers through METRICS_DIR, whichever one answers
+    return Response(
+        metrics.render_prometheus(),
+        mimetype="text/plain; version=0.0.4"
+    )
+
+
+@app.route("/cache-stats")
+def cache_stats():
+    return jsonify(result_cache.stats())
 
 
 @app.route("/parse-report", methods=["POST"])
 def parse_report():
 
-    auth = request.headers.get("Authorization", "")
-    if auth != f"Bearer {API_KEY}":
+    if not authorized():
         return jsonify({"error": "unauthorized"}), 401
 
     if "file" not in request.files:
@@ -37,21 +104,187 @@ def parse_report():
     pdf_bytes = file.read()
 
     debug = request.form.get("debug") in ["true", "1", "yes"]
+    want_timings = request.form.get("timings") in ["true", "1", "yes"]
 
-    try:
-        result = extract_scores(pdf_bytes, debug=debug)
-    except Exception as e:
-        return jsonify({
-            "error": "parser_failure",
-            "message": str(e)
-        }), 500
+    # lower dpi trades accuracy on borderline colours for latency
+    dpi = request.form.get("dpi")
+
+    if dpi is not None:
+        try:
+            dpi = int(dpi)
+        except ValueError:
+            dpi = 0
+        if not MIN_DPI <= dpi <= MAX_DPI:
+            return jsonify({
+                "error": "bad_dpi",
+                "message": f"dpi must be between {MIN_DPI} and {MAX_DPI}"
+            }), 400
+
+    # overlay options: debug_crop, debug_scale (0-1], debug_format
+    options = None
+
+    if debug:
+        try:
+            options = debug_options(
+                cropped=(
+                    request.form.get("debug_crop") in ["true", "1", "yes"]
+                    if "debug_crop" in request.form else None
+                ),
+                scale=request.form.get("debug_scale"),
+                fmt=request.form.get("debug_format")
+            )
+        except ValueError as e:
+            return jsonify({"error": "bad_debug_options", "message": str(e)}), 400
+
+    variant = "scores"
 
     if debug:
-        return Response(result, mimetype="image/png")
+        variant = "debug:{cropped}:{scale}:{fmt}".format(**options)
+
+    if dpi is not None:
+        variant = f"{variant}@{dpi}"
+
+    overlay = None
+
+    with metrics.request_timings() as timings, metrics.timed("handler"):
+
+        with metrics.timed("cache_lookup"):
+            cache_key = result_cache.key(pdf_bytes, variant)
+            result = result_cache.get(cache_key)
+
+            # the overlay bytes and their scores are cached side by side
+            if debug and result is not None:
+                overlay = result
+                result = result_cache.get(result_cache.key(pdf_bytes, variant + ":result"))
+
+        if result is None:
+
+            try:
+                if debug:
+                    result, overlay, _ = parse_report_with_overlay(pdf_bytes, dpi=dpi, **options)
+                else:
+                    result = parse_document(pdf_bytes, dpi=dpi)
+            except Exception as e:
+                return jsonify({
+                    "error": "parser_failure",
+                    "message": str(e)
+                }), 500
+
+            with metrics.timed("cache_store"):
+                if debug:
+                    result_cache.put(cache_key, overlay)
+                    result_cache.put(result_cache.key(pdf_bytes, variant + ":result"), result)
+                else:
+                    result_cache.put(cache_key, result)
+
+    if debug:
+        _, _, mimetype = DEBUG_ENCODINGS[options["fmt"]]
+
+        # stored per request, even on a cache hit, so the id stays live
+        # for as long as this response could be followed up
+        artifact_id = debug_store.put(overlay, mimetype)
+
+        # no link to an artifact that was never written
+        if artifact_id is not None:
+            result = dict(result, debug={
+                "id": artifact_id,
+                "url": f"/debug/{artifact_id}",
+                "mimetype": mimetype,
+                "bytes": len(overlay)
+            })
+
+    if want_timings:
+        result["timings"] = timings
 
     return jsonify(result)
 
 
+@app.route("/parse-reports", methods=["POST"])
+def parse_reports():
+
+    if not authorized():
+        return jsonify({"error": "unauthorized"}), 401
+
+    # any number of "files" (or "file") parts; each a PDF or a zip of PDFs
+    uploads = request.files.getlist("files") + request.files.getlist("file")
+
+    if not uploads:
+        return jsonify({"error": "no file"}), 400
+
+    try:
+        named = collect_pdfs(
+            (upload.filename or "upload.pdf", upload.read())
+            for upload in uploads
+        )
+    except ValueError as e:
+        return jsonify({"error": "bad_batch", "message": str(e)}), 400
+
+    with metrics.timed("batch_handler"):
+        results, errors = parse_many(named)
+
+    return jsonify({
+        "results": results,
+        "errors": errors
+    })
+
+
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+
+    if not authorized():
+        return jsonify({"error": "unauthorized"}), 401
+
+    if "file" not in request.files:
+        return jsonify({"error": "no file"}), 400
+
+    file = request.files["file"]
+
+    # workers normally start in post_fork; this retries after a failed start
+    try:
+        jobs.ensure_workers()
+        job_id = jobs.submit_job(file.read(), filename=file.filename)
+    except sqlite3.Error as e:
+        return job_queue_unavailable(e)
+
+    return jsonify({"job_id": job_id, "status": "queued"}), 202
+
+
+@app.route("/jobs", methods=["GET"])
+def job_queue():
+
+    if not authorized():
+        return jsonify({"error": "unauthorized"}), 401
+
+    try:
+        return jsonify(jobs.queue_depth())
+    except sqlite3.Error as e:
+        return job_queue_unavailable(e)
+
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+
+    if not authorized():
+        return jsonify({"error": "unauthorized"}), 401
+
+    try:
+        job = jobs.get_job(job_id)
+    except sqlite3.Error as e:
+        return job_queue_unavailable(e)
+
+    if job is None:
+        return jsonify({"error": "not_found"}), 404
+
+    return jsonify(job)
+
+
 if __name__ == "__main__":
+    metrics.enable_directory()
+    metrics.reset_directory()
+    try:
+        jobs.ensure_workers()
+    except sqlite3.Error:
+        # serve parsing without the queue; /jobs reports it unavailable
+        pass
     port = int(os.environ.get("PORT", 10000))
     app.run(host="0.0.0.0", port=port)
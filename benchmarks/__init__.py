@@ -0,0 +1 @@
+# benchmark scripts
\ No newline at end of file
@@ -0,0 +1,181 @@
+import argparse
+import sys
+
+import cv2
+import numpy as np
+
+from parser.extract import MIN_Y, classify_bar, classify_rows, detect_column_rows
+
+# Generated bar column size at dpi=200
+COLUMN_HEIGHT = 1170
+COLUMN_WIDTH = 15
+
+# Rows sampled per generated column
+SAMPLED_ROWS = 25
+
+
+# ------------------------------------------------
+# REFERENCE LOOPS
+# ------------------------------------------------
+def reference_rows(column, y_offset=MIN_Y):
+
+    # the per-line loop detect_rows used before vectorization
+    hsv = cv2.cvtColor(column, cv2.COLOR_BGR2HSV)
+
+    rows = []
+
+    inside = False
+    start = 0
+
+    for y in range(hsv.shape[0]):
+
+        s = np.mean(hsv[y,:,1])
+
+        if s > 40 and not inside:
+            start = y
+            inside = True
+
+        if s < 20 and inside:
+
+            end = y
+
+            if 10 < (end-start) < 40:
+                rows.append((start+y_offset,end+y_offset))
+
+            inside = False
+
+    filtered = []
+
+    for r in rows:
+
+        if not filtered:
+            filtered.append(r)
+            continue
+
+        if r[0] - filtered[-1][0] > 18:
+            filtered.append(r)
+
+    return filtered
+
+
+def reference_sample(column, y1, y2, y_offset=MIN_Y):
+
+    # the per-row sample_bar_color used before batching
+    mid = int((y1+y2)/2) - y_offset
+
+    sample = column[mid-2:mid+2]
+
+    hsv = cv2.cvtColor(sample, cv2.COLOR_BGR2HSV)
+
+    h = np.mean(hsv[:,:,0])
+    s = np.mean(hsv[:,:,1])
+    v = np.mean(hsv[:,:,2])
+
+    return np.array([h,s,v])
+
+
+# ------------------------------------------------
+# GENERATED COLUMNS
+# ------------------------------------------------
+def random_column(rng):
+
+    # bars of random height, gap and colour on a faintly tinted background,
+    # with saturations near the hysteresis thresholds and noise on top
+    hsv = np.zeros((COLUMN_HEIGHT, COLUMN_WIDTH, 3), dtype=np.float64)
+
+    hsv[..., 0] = rng.uniform(90, 120)
+    hsv[..., 1] = rng.uniform(0, 25)
+    hsv[..., 2] = rng.uniform(200, 255)
+
+    y = int(rng.integers(0, 30))
+
+    while y < COLUMN_HEIGHT:
+
+        height = int(rng.integers(3, 55))
+
+        hsv[y:y + height, :, 0] = rng.uniform(90, 120)
+        hsv[y:y + height, :, 1] = rng.choice([rng.uniform(15, 45), rng.uniform(45, 255)])
+        hsv[y:y + height, :, 2] = rng.uniform(60, 255)
+
+        y += height + int(rng.integers(1, 40))
+
+    hsv[..., 1:] += rng.normal(0, rng.uniform(0, 8), (COLUMN_HEIGHT, COLUMN_WIDTH, 2))
+
+    hsv = np.clip(hsv, 0, 255).astype(np.uint8)
+
+    return cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+
+
+# ------------------------------------------------
+# CHECKS
+# ------------------------------------------------
+def check_rows(columns, rng):
+
+    mismatches = 0
+
+    for column in columns:
+        if detect_column_rows(column) != reference_rows(column):
+            mismatches += 1
+
+    return mismatches, len(columns)
+
+
+def check_colors(columns, rng):
+
+    # every row's label and H/S/V means against the per-row functions
+    mismatches = 0
+
+    for column in columns:
+
+        y1 = rng.integers(MIN_Y + 2, MIN_Y + COLUMN_HEIGHT - 40, SAMPLED_ROWS)
+        rows = np.stack((y1, y1 + rng.integers(11, 40, SAMPLED_ROWS)), axis=1)
+
+        labels, samples = classify_rows(column, rows)
+
+        for (a, b), label, sample in zip(rows, labels, samples):
+
+            expected = reference_sample(column, a, b)
+
+            if label != classify_bar(expected) or not np.allclose(sample, expected):
+                mismatches += 1
+
+    return mismatches, len(columns) * SAMPLED_ROWS
+
+
+CHECKS = {
+    "rows": check_rows,
+    "colors": check_colors
+}
+
+
+# ------------------------------------------------
+# DRIVER
+# ------------------------------------------------
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Check vectorized row detection and colour sampling against the reference loops"
+    )
+    parser.add_argument("--columns", type=int, default=500,
+                        help="generated bar columns to compare")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+
+    columns = [random_column(rng) for _ in range(args.columns)]
+
+    failed = False
+
+    for name, check in CHECKS.items():
+
+        mismatches, compared = check(columns, rng)
+        failed = failed or mismatches > 0
+
+        print(f"{name:10s} {compared - mismatches:6d}/{compared} identical")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
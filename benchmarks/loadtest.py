@@ -0,0 +1,319 @@
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+
+DEFAULT_API_KEY = "ithrive_secure_2026_key"
+
+# A step whose throughput gain over the previous one falls below this is
+# past the knee of the curve
+KNEE_GAIN = 0.10
+
+
+# ------------------------------------------------
+# REQUESTS
+# ------------------------------------------------
+def multipart(pdf_bytes, filename, fields):
+
+    boundary = uuid.uuid4().hex
+
+    parts = []
+
+    for name, value in fields.items():
+        parts.append(
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+            f"{value}\r\n".encode()
+        )
+
+    parts.append(
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f"Content-Type: application/pdf\r\n\r\n".encode()
+    )
+    parts.append(pdf_bytes)
+    parts.append(f"\r\n--{boundary}--\r\n".encode())
+
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def bust_cache(pdf_bytes):
+
+    # a trailing comment after %%EOF changes the content hash (and so the
+    # server's cache key) without changing the document
+    return pdf_bytes + f"\n%{uuid.uuid4().hex}\n".encode()
+
+
+class Client:
+
+    def __init__(self, url, api_key, debug, use_cache):
+
+        parsed = urllib.parse.urlsplit(url)
+
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.path = (parsed.path.rstrip("/") or "") + "/parse-report"
+        self.api_key = api_key
+        self.debug = debug
+        self.use_cache = use_cache
+
+        self.conn = None
+
+    def post(self, pdf_bytes, filename):
+
+        if not self.use_cache:
+            pdf_bytes = bust_cache(pdf_bytes)
+
+        fields = {"debug": "true"} if self.debug else {}
+
+        body, content_type = multipart(pdf_bytes, filename, fields)
+
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": content_type
+        }
+
+        # keep-alive connection per client thread; reconnect on failure
+        for attempt in range(2):
+
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=300)
+
+            try:
+                self.conn.request("POST", self.path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                response.read()
+                return response.status
+            except (http.client.HTTPException, OSError):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+
+# ------------------------------------------------
+# ONE CONCURRENCY STEP
+# ------------------------------------------------
+def percentile(sorted_values, q):
+
+    if not sorted_values:
+        return None
+
+    i = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+
+    return sorted_values[i]
+
+
+def run_step(args, corpus, concurrency):
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    deadline = time.perf_counter() + args.duration
+
+    def worker(worker_id):
+
+        client = Client(args.url, args.api_key, args.debug, args.use_cache)
+
+        i = worker_id
+
+        while time.perf_counter() < deadline:
+
+            name, pdf_bytes = corpus[i % len(corpus)]
+            i += concurrency
+
+            start = time.perf_counter()
+
+            try:
+                status = client.post(pdf_bytes, name)
+            except Exception as e:
+                status = type(e).__name__
+
+            elapsed = time.perf_counter() - start
+
+            with lock:
+                if status == 200:
+                    latencies.append(elapsed)
+                else:
+                    errors.append(status)
+
+    started = time.perf_counter()
+
+    threads = [
+        threading.Thread(target=worker, args=(w,), daemon=True)
+        for w in range(concurrency)
+    ]
+
+    for t in threads:
+        t.start()
+
+    for t in threads:
+        t.join()
+
+    wall = time.perf_counter() - started
+
+    ms = sorted(v * 1000 for v in latencies)
+    total = len(latencies) + len(errors)
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "rps": round(len(latencies) / wall, 2),
+        "error_rate": round(len(errors) / total, 4) if total else 0.0,
+        "errors": sorted({str(e) for e in errors}),
+        "p50_ms": round(percentile(ms, 0.50), 1) if ms else None,
+        "p95_ms": round(percentile(ms, 0.95), 1) if ms else None,
+        "p99_ms": round(percentile(ms, 0.99), 1) if ms else None
+    }
+
+
+def find_knee(steps, min_gain=KNEE_GAIN):
+
+    # last concurrency that still bought a meaningful throughput increase
+    knee = steps[0]
+
+    for prev, step in zip(steps, steps[1:]):
+
+        if prev["rps"] <= 0 or step["rps"] / prev["rps"] - 1 < min_gain:
+            break
+
+        knee = step
+
+    return knee
+
+
+# ------------------------------------------------
+# CORPUS AND SERVER
+# ------------------------------------------------
+def load_pdfs(paths, synth_count):
+
+    corpus = []
+
+    for path in paths:
+
+        if os.path.isdir(path):
+            names = sorted(n for n in os.listdir(path) if n.endswith(".pdf"))
+            files = [os.path.join(path, n) for n in names]
+        else:
+            files = [path]
+
+        for file in files:
+            with open(file, "rb") as f:
+                corpus.append((os.path.basename(file), f.read()))
+
+    if synth_count:
+
+        from benchmarks.synth import generate_corpus
+
+        for i, (pdf_bytes, _) in enumerate(generate_corpus(synth_count)):
+            corpus.append((f"synth_{i:05d}.pdf", pdf_bytes))
+
+    return corpus
+
+
+def start_server(port):
+
+    env = dict(os.environ, PORT=str(port))
+
+    proc = subprocess.Popen(
+        [sys.executable, "app.py"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+    # wait for the health check
+    for _ in range(100):
+
+        if proc.poll() is not None:
+            raise RuntimeError("app.py exited during startup")
+
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/")
+            if conn.getresponse().status == 200:
+                return proc
+        except OSError:
+            pass
+
+        time.sleep(0.2)
+
+    proc.terminate()
+    raise RuntimeError("app.py did not become ready")
+
+
+# ------------------------------------------------
+# DRIVER
+# ------------------------------------------------
+def main():
+
+    parser = argparse.ArgumentParser(description="Load test /parse-report")
+    parser.add_argument("pdfs", nargs="*", default=["sample.pdf"],
+                        help="PDF files or directories of PDFs")
+    parser.add_argument("--url", default="http://127.0.0.1:10000")
+    parser.add_argument("--start-server", action="store_true",
+                        help="start app.py locally on the --url port")
+    parser.add_argument("--api-key", default=os.environ.get("API_KEY", DEFAULT_API_KEY))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--duration", type=float, default=15.0,
+                        help="seconds per concurrency step")
+    parser.add_argument("--debug", action="store_true", help="send debug=true")
+    parser.add_argument("--use-cache", action="store_true",
+                        help="resend identical bytes so the result cache can answer")
+    parser.add_argument("--synth", type=int, default=0,
+                        help="add this many generated reports to the corpus")
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    corpus = load_pdfs(args.pdfs, args.synth)
+
+    if not corpus:
+        parser.error("no PDFs to send")
+
+    server = None
+
+    if args.start_server:
+        server = start_server(urllib.parse.urlsplit(args.url).port or 80)
+
+    steps = []
+
+    try:
+        print(f"{'conc':>5s} {'req':>7s} {'rps':>8s} {'p50':>9s} {'p95':>9s} {'p99':>9s} {'err':>7s}")
+
+        for concurrency in args.concurrency:
+
+            step = run_step(args, corpus, concurrency)
+            steps.append(step)
+
+            print(
+                f"{step['concurrency']:5d} {step['requests']:7d} {step['rps']:8.2f}"
+                f" {step['p50_ms'] or 0:8.1f}ms {step['p95_ms'] or 0:8.1f}ms"
+                f" {step['p99_ms'] or 0:8.1f}ms {step['error_rate']:7.2%}"
+            )
+
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    knee = find_knee(steps)
+
+    print(
+        f"\nsaturation: ~{knee['rps']} req/s at concurrency {knee['concurrency']}"
+        f" (p95 {knee['p95_ms']} ms)"
+    )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"steps": steps, "knee": knee}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import argparse
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+MODES = ["full", "targeted", "strip"]
+
+
+# ------------------------------------------------
+# RENDER MODES
+# ------------------------------------------------
+def render_full(pdf_bytes):
+
+    # previous behaviour: rasterize every page, keep page 2
+    from pdf2image import convert_from_bytes
+
+    images = convert_from_bytes(pdf_bytes, dpi=200)
+
+    return np.array(images[1])
+
+
+def render_targeted(pdf_bytes):
+
+    from parser.render import render_score_page
+
+    return render_score_page(pdf_bytes)
+
+
+def render_strip(pdf_bytes):
+
+    from parser.extract import render_bar_column
+
+    return render_bar_column(pdf_bytes)
+
+
+RENDERERS = {
+    "full": render_full,
+    "targeted": render_targeted,
+    "strip": render_strip
+}
+
+
+# ------------------------------------------------
+# SINGLE MODE (runs in its own process)
+# ------------------------------------------------
+def peak_rss_mb():
+
+    # ru_maxrss is KiB on Linux; children covers the pdftoppm subprocess
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    return round(own / 1024, 1), round(children / 1024, 1)
+
+
+def run_mode(mode, pdf_path, repeat):
+
+    with open(pdf_path, "rb") as f:
+        pdf_bytes = f.read()
+
+    render = RENDERERS[mode]
+
+    timings = []
+
+    for _ in range(repeat):
+
+        start = time.perf_counter()
+
+        render(pdf_bytes)
+
+        timings.append((time.perf_counter() - start) * 1000)
+
+    own, children = peak_rss_mb()
+
+    return {
+        "mode": mode,
+        "median_ms": round(statistics.median(timings), 1),
+        "min_ms": round(min(timings), 1),
+        "peak_rss_mb": own,
+        "peak_child_rss_mb": children
+    }
+
+
+# ------------------------------------------------
+# DRIVER
+# ------------------------------------------------
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Compare full-document, score-page and bar-strip rendering"
+    )
+    parser.add_argument("pdf", nargs="?", default="sample.pdf")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--mode", choices=MODES)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.pdf, args.repeat)))
+        return
+
+    # each mode gets a fresh interpreter so peak RSS is not shared
+    for mode in MODES:
+
+        out = subprocess.run(
+            [
+                sys.executable, "-m", "benchmarks.render_bench",
+                args.pdf,
+                "--repeat", str(args.repeat),
+                "--mode", mode
+            ],
+            check=True,
+            capture_output=True,
+            text=True
+        )
+
+        result = json.loads(out.stdout)
+
+        print(
+            f"{mode:10s} median {result['median_ms']:8.1f} ms"
+            f"  min {result['min_ms']:8.1f} ms"
+            f"  peak rss {result['peak_rss_mb']:7.1f} MB"
+            f"  pdftoppm {result['peak_child_rss_mb']:7.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
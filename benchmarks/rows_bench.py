@@ -0,0 +1,269 @@
+import argparse
+import json
+import os
+import statistics
+import time
+
+import cv2
+import numpy as np
+
+from parser.anchors import detect_all_anchors
+from parser.render import render_score_page
+from parser.rows import ROW_MAX_HEIGHT, ROW_MIN_HEIGHT, detect_rows, detect_rows_hough
+
+# A row within this many pixels of its reference position counts as found
+MATCH_TOLERANCE = 3
+
+# Rows closer than this are near-duplicates of one table line
+DUPLICATE_DISTANCE = 20
+
+# Generated score page at dpi=200
+PAGE_SHAPE = (2200, 1700)
+
+
+# ------------------------------------------------
+# METHODS
+# ------------------------------------------------
+def hough_rows(img, anchors):
+
+    # HoughLinesP finds the separator lines; the rows it implies are the
+    # gaps between consecutive lines of a plausible row height
+    lines = detect_rows_hough(img, anchors)
+
+    return [
+        (a + b) / 2
+        for a, b in zip(lines, lines[1:])
+        if ROW_MIN_HEIGHT <= b - a <= ROW_MAX_HEIGHT
+    ]
+
+
+METHODS = {
+    "projection": detect_rows,
+    "hough": hough_rows
+}
+
+
+# ------------------------------------------------
+# CORPUS
+# ------------------------------------------------
+def table_page(rng):
+
+    # score page with a drawn label table: grey cells with light label
+    # text between dark separator lines spanning the table, as in the
+    # real report. Returns (page, anchors, row centres).
+    page = np.full(PAGE_SHAPE + (3,), 255, np.uint8)
+
+    risk_bar_x = int(rng.integers(900, 990))
+    left = risk_bar_x - int(rng.integers(560, 660))
+    right = risk_bar_x + int(rng.integers(500, 620))
+
+    y = int(rng.integers(150, 400))
+
+    centres = []
+
+    for i in range(int(rng.integers(24, 31))):
+
+        thickness = int(rng.integers(3, 6))
+        height = int(rng.integers(22, 42))
+
+        cv2.rectangle(page, (left, y), (right, y + thickness - 1),
+                      (int(rng.integers(55, 85)),) * 3, -1)
+
+        top = y + thickness
+        cell = int(rng.integers(100, 126))
+
+        cv2.rectangle(page, (left, top), (right, top + height - 1), (cell,) * 3, -1)
+
+        # label text in the cell's left half, bar track right of the anchor
+        text_w = int(rng.integers(60, 240))
+        mid = top + height // 2
+        cv2.rectangle(page, (left + 12, mid - 5), (left + 12 + text_w, mid + 5),
+                      (int(rng.integers(200, 245)),) * 3, -1)
+        cv2.rectangle(page, (risk_bar_x, mid - 8), (risk_bar_x + 230, mid + 8),
+                      (150, 150, 150), -1)
+
+        centres.append(top + height / 2)
+
+        y = top + height
+
+    thickness = int(rng.integers(3, 6))
+    cv2.rectangle(page, (left, y), (right, y + thickness - 1), (70, 70, 70), -1)
+
+    return page, {"risk_bar_x": risk_bar_x}, centres
+
+
+def generated_pages(count, seed):
+
+    rng = np.random.default_rng(seed)
+
+    return [(f"table_{i:03d}",) + table_page(rng) for i in range(count)]
+
+
+def labelled_pages(paths):
+
+    # score pages of real PDFs with hand-labelled row centres (dpi=200)
+    # in a <name>.rows.json file next to each PDF
+    pages = []
+
+    for path in paths:
+
+        if os.path.isdir(path):
+            names = sorted(n for n in os.listdir(path) if n.endswith(".pdf"))
+            files = [os.path.join(path, n) for n in names]
+        else:
+            files = [path]
+
+        for file in files:
+
+            labels = os.path.splitext(file)[0] + ".rows.json"
+
+            if not os.path.exists(labels):
+                raise SystemExit(f"{file}: no row labels in {labels}")
+
+            with open(file, "rb") as f:
+                page = render_score_page(f.read())
+
+            with open(labels) as f:
+                centres = json.load(f)
+
+            pages.append((os.path.basename(file), page, detect_all_anchors(page), centres))
+
+    return pages
+
+
+def jitter(page, rng):
+
+    # scan-like copy with a known vertical shift
+    noise = rng.normal(0, 4, page.shape)
+    gain = rng.uniform(0.92, 1.05)
+    shift = int(rng.integers(-6, 7))
+
+    out = np.clip(page * gain + noise, 0, 255).astype(np.uint8)
+
+    return np.roll(out, shift, axis=0), shift
+
+
+# ------------------------------------------------
+# SCORING
+# ------------------------------------------------
+def match(found, reference):
+
+    # greedy one-to-one matching within MATCH_TOLERANCE
+    unused = list(reference)
+    errors = []
+
+    for y in found:
+
+        if not unused:
+            break
+
+        i = int(np.argmin([abs(y - r) for r in unused]))
+
+        if abs(y - unused[i]) <= MATCH_TOLERANCE:
+            errors.append(abs(y - unused[i]))
+            unused.pop(i)
+
+    return errors, len(unused)
+
+
+def duplicates(rows):
+
+    return sum(1 for a, b in zip(rows, rows[1:]) if b - a < DUPLICATE_DISTANCE)
+
+
+def evaluate(method, pages, variants, seed):
+
+    detect = METHODS[method]
+
+    rng = np.random.default_rng(seed)
+
+    timings = []
+    counts = []
+    errors = []
+    expected = 0
+    missing = 0
+    extra = 0
+    dupes = 0
+
+    # every method is scored against the same drawn / labelled centres
+    for _, page, anchors, reference in pages:
+
+        for _ in range(variants):
+
+            # a vertical shift leaves the risk bar anchor's x unchanged
+            copy, shift = jitter(page, rng)
+
+            start = time.perf_counter()
+            rows = detect(copy, anchors)
+            timings.append(time.perf_counter() - start)
+
+            rows = [y - shift for y in rows]
+
+            matched, lost = match(rows, reference)
+
+            counts.append(len(rows))
+            errors.extend(matched)
+            expected += len(reference)
+            missing += lost
+            extra += len(rows) - len(matched)
+            dupes += duplicates(rows)
+
+    ms = sorted(t * 1000 for t in timings)
+
+    return {
+        "method": method,
+        "pages": len(timings),
+        "median_ms": round(statistics.median(ms), 3),
+        "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 3),
+        "rows_per_page": round(statistics.fmean(counts), 2),
+        "recall": round(1 - missing / expected, 4) if expected else None,
+        "mean_error_px": round(statistics.fmean(errors), 3) if errors else None,
+        "missing": missing,
+        "extra": extra,
+        "near_duplicates": dupes
+    }
+
+
+# ------------------------------------------------
+# DRIVER
+# ------------------------------------------------
+def main():
+
+    parser = argparse.ArgumentParser(description="Compare row detectors")
+    parser.add_argument("pdfs", nargs="*",
+                        help="PDF files or directories of PDFs with .rows.json labels")
+    parser.add_argument("--tables", type=int, default=20,
+                        help="generated table pages with known row centres")
+    parser.add_argument("--variants", type=int, default=5,
+                        help="jittered copies per page")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    pages = generated_pages(args.tables, args.seed) + labelled_pages(args.pdfs)
+
+    if not pages:
+        parser.error("no pages to score")
+
+    results = [evaluate(m, pages, args.variants, args.seed) for m in METHODS]
+
+    print(
+        f"{'method':12s} {'median':>10s} {'p95':>10s} {'rows':>6s} {'recall':>7s}"
+        f" {'err px':>7s} {'miss':>5s} {'extra':>6s} {'dupes':>6s}"
+    )
+
+    for r in results:
+        print(
+            f"{r['method']:12s} {r['median_ms']:8.3f}ms {r['p95_ms']:8.3f}ms"
+            f" {r['rows_per_page']:6.1f} {r['recall'] or 0:7.2%}"
+            f" {r['mean_error_px'] or 0:7.3f}"
+            f" {r['missing']:5d} {r['extra']:6d} {r['near_duplicates']:6d}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,582 @@
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+DEFAULT_PDF = "sample.pdf"
+DEFAULT_RESULT = "bench_results.json"
+
+# Relative slowdown of a stage's median that counts as a regression
+REGRESSION_THRESHOLD = 0.10
+
+SAMPLE_SCORES = {
+    "large_artery_stiffness": "red",
+    "peripheral_vessel": "orange",
+    "blood_pressure_uncontrolled": "yellow",
+    "metabolic_syndrome": "orange",
+    "insulin_resistance": "yellow",
+    "tissue_inflammatory_process": "red",
+    "respiratory_disorders": "yellow",
+    "major_depression": "orange",
+    "cerebral_dopamine_decreased": "yellow"
+}
+
+
+# ------------------------------------------------
+# INPUTS
+# ------------------------------------------------
+def render_sample(pdf_bytes):
+
+    from parser.render import render_score_page
+
+    return render_score_page(pdf_bytes)
+
+
+def jitter_pages(page, count, seed=0):
+
+    # scan-like variants of the score page: sensor noise, exposure and a
+    # small vertical offset
+    rng = np.random.default_rng(seed)
+
+    pages = []
+
+    for _ in range(count):
+
+        noise = rng.normal(0, 4, page.shape)
+        gain = rng.uniform(0.92, 1.05)
+        shift = int(rng.integers(-3, 4))
+
+        out = np.clip(page * gain + noise, 0, 255).astype(np.uint8)
+
+        pages.append(np.roll(out, shift, axis=0))
+
+    return pages
+
+
+def pages_to_pdf(pages, dpi=200):
+
+    # wrap rendered pages as a scanned PDF, page 2 being the score page
+    from PIL import Image
+
+    images = [Image.fromarray(p) for p in pages]
+
+    buf = io.BytesIO()
+
+    images[0].save(
+        buf,
+        format="PDF",
+        save_all=True,
+        append_images=images[1:],
+        resolution=dpi
+    )
+
+    return buf.getvalue()
+
+
+def generated_corpus(page, count):
+
+    blank = np.full_like(page, 255)
+
+    return [pages_to_pdf([blank, p]) for p in jitter_pages(page, count)]
+
+
+# ------------------------------------------------
+# STAGES
+# ------------------------------------------------
+# Each setup takes the sample PDF bytes and returns a zero-argument
+# callable running one operation of that stage.
+
+def setup_convert_from_bytes(pdf_bytes):
+
+    from pdf2image import convert_from_bytes
+
+    return lambda: convert_from_bytes(pdf_bytes, dpi=200)
+
+
+def use_rasterizer(name):
+
+    # stages run in their own process, so switching the default is safe
+    from parser import render
+
+    if name is not None:
+        render.get_rasterizer(name)
+        render.RASTERIZER = name
+
+
+def setup_render_page(pdf_bytes, rasterizer=None):
+
+    from parser.render import render_score_page
+
+    use_rasterizer(rasterizer)
+
+    return lambda: render_score_page(pdf_bytes)
+
+
+def setup_render_strip(pdf_bytes, rasterizer=None):
+
+    from parser.extract import render_bar_column
+
+    use_rasterizer(rasterizer)
+
+    return lambda: render_bar_column(pdf_bytes)
+
+
+def setup_render_page_poppler(pdf_bytes):
+
+    return setup_render_page(pdf_bytes, "poppler")
+
+
+def setup_render_page_pymupdf(pdf_bytes):
+
+    return setup_render_page(pdf_bytes, "pymupdf")
+
+
+def setup_render_strip_poppler(pdf_bytes):
+
+    return setup_render_strip(pdf_bytes, "poppler")
+
+
+def setup_render_strip_pymupdf(pdf_bytes):
+
+    return setup_render_strip(pdf_bytes, "pymupdf")
+
+
+def setup_detect_rows(pdf_bytes):
+
+    from parser.extract import bar_column, detect_column_rows
+
+    columns = cycle(
+        [bar_column(p).copy() for p in jitter_pages(render_sample(pdf_bytes), 16)]
+    )
+
+    return lambda: detect_column_rows(next(columns))
+
+
+def setup_sample_classify_per_row(pdf_bytes):
+
+    from parser.extract import classify_bar, detect_rows, sample_bar_color
+
+    page = render_sample(pdf_bytes)
+    rows = detect_rows(page)
+
+    return lambda: [classify_bar(sample_bar_color(page, y1, y2)) for y1, y2 in rows]
+
+
+def setup_anchors(pdf_bytes, mode):
+
+    from parser.anchors import detect_all_anchors
+
+    page = render_sample(pdf_bytes)
+
+    # the coarse-to-fine search must agree with the full-page one
+    expected = detect_all_anchors(page, "full")
+    result = detect_all_anchors(page, mode)
+
+    if result != expected:
+        raise ValueError(f"anchors differ: {result} != {expected}")
+
+    return lambda: detect_all_anchors(page, mode)
+
+
+def setup_anchors_full(pdf_bytes):
+
+    return setup_anchors(pdf_bytes, "full")
+
+
+def setup_anchors_coarse(pdf_bytes):
+
+    return setup_anchors(pdf_bytes, "coarse")
+
+
+def setup_classify_rows(pdf_bytes):
+
+    from parser.extract import bar_column, classify_rows, detect_column_rows
+
+    column = bar_column(render_sample(pdf_bytes))
+    rows = detect_column_rows(column)
+
+    return lambda: classify_rows(column, rows)
+
+
+def setup_debug_overlay(pdf_bytes, cropped=False, scale=1.0, fmt="png"):
+
+    from parser.extract import (
+        DISEASES,
+        bar_column,
+        classify_rows,
+        detect_rows,
+        draw_debug,
+        encode_overlay,
+        render_debug_view
+    )
+
+    page, origin = render_debug_view(pdf_bytes, cropped=cropped)
+
+    full = render_sample(pdf_bytes)
+    rows = detect_rows(full)
+    labels, _ = classify_rows(bar_column(full), rows)
+    scores = dict(zip(DISEASES, labels))
+
+    def run():
+        overlay = draw_debug(page, rows, scores, origin=origin)
+        return encode_overlay(overlay, scale, fmt)
+
+    return run
+
+
+def setup_debug_overlay_fast(pdf_bytes):
+
+    # cropped, half size, JPEG
+    return setup_debug_overlay(pdf_bytes, cropped=True, scale=0.5, fmt="jpeg")
+
+
+def setup_debug_report(pdf_bytes, **options):
+
+    from parser.extract import parse_report_with_overlay
+
+    return lambda: parse_report_with_overlay(pdf_bytes, **options)
+
+
+def setup_debug_report_fast(pdf_bytes):
+
+    return setup_debug_report(pdf_bytes, cropped=True, scale=0.5, fmt="jpeg")
+
+
+def setup_vector_extract(pdf_bytes):
+
+    from parser.vector_extract import parse_vector_report
+
+    return lambda: parse_vector_report(pdf_bytes)
+
+
+def setup_system_engine(pdf_bytes):
+
+    from parser.system_engine import compute_consultation_summary, compute_system_summary
+
+    return lambda: compute_consultation_summary(compute_system_summary(SAMPLE_SCORES))
+
+
+def setup_pattern_protocol_narrative(pdf_bytes):
+
+    from engine.narrative_engine import generate_health_narrative
+    from engine.pattern_engine import detect_patterns
+    from engine.protocol_engine import build_protocol
+    from parser.system_engine import compute_consultation_summary, compute_system_summary
+
+    system = compute_system_summary(SAMPLE_SCORES)
+    consultation = compute_consultation_summary(system)
+
+    def run():
+        protocol = build_protocol(detect_patterns(SAMPLE_SCORES))
+        return generate_health_narrative(system, consultation, protocol)
+
+    return run
+
+
+def setup_interpretation_engine(pdf_bytes):
+
+    from interpretation.interpretation_engine import interpret_scan
+
+    return lambda: interpret_scan(SAMPLE_SCORES)
+
+
+def setup_extract_scores(pdf_bytes):
+
+    from parser.extract import extract_scores
+
+    return lambda: extract_scores(pdf_bytes)
+
+
+def setup_extract_scores_corpus(pdf_bytes):
+
+    from parser.extract import extract_scores
+
+    corpus = cycle(generated_corpus(render_sample(pdf_bytes), 8))
+
+    return lambda: extract_scores(next(corpus))
+
+
+def setup_extract_scores_synth(pdf_bytes, vector=False):
+
+    from benchmarks.synth import generate_corpus
+    from parser.extract import extract_scores
+
+    corpus = cycle([
+        report for report, _ in
+        generate_corpus(8, seed=1, vector_fraction=1.0 if vector else 0.0)
+    ])
+
+    return lambda: extract_scores(next(corpus))
+
+
+def setup_extract_scores_synth_vector(pdf_bytes):
+
+    return setup_extract_scores_synth(pdf_bytes, vector=True)
+
+
+def setup_parse_document_combined(pdf_bytes, workers=None):
+
+    from benchmarks.synth import generate_combined
+    from parser import document
+
+    if workers is not None:
+        document.PAGE_WORKERS = workers
+
+    # 10 patients x 2 pages: a 20-page combined export
+    combined, _ = generate_combined(
+        np.random.default_rng(2), 10, min_pages=2, max_pages=2, dpis=(200,)
+    )
+
+    return lambda: document.parse_document(combined)
+
+
+def setup_parse_document_combined_serial(pdf_bytes):
+
+    return setup_parse_document_combined(pdf_bytes, workers=1)
+
+
+def cycle(items):
+
+    while True:
+        yield from items
+
+
+STAGES = {
+    "convert_from_bytes": setup_convert_from_bytes,
+    "render_page": setup_render_page,
+    "render_strip": setup_render_strip,
+    "render_page_poppler": setup_render_page_poppler,
+    "render_page_pymupdf": setup_render_page_pymupdf,
+    "render_strip_poppler": setup_render_strip_poppler,
+    "render_strip_pymupdf": setup_render_strip_pymupdf,
+    "detect_rows": setup_detect_rows,
+    "sample_classify_per_row": setup_sample_classify_per_row,
+    "classify_rows": setup_classify_rows,
+    "anchors_full": setup_anchors_full,
+    "anchors_coarse": setup_anchors_coarse,
+    "debug_overlay": setup_debug_overlay,
+    "debug_overlay_fast": setup_debug_overlay_fast,
+    "debug_report": setup_debug_report,
+    "debug_report_fast": setup_debug_report_fast,
+    "vector_extract": setup_vector_extract,
+    "system_engine": setup_system_engine,
+    "pattern_protocol_narrative": setup_pattern_protocol_narrative,
+    "interpretation_engine": setup_interpretation_engine,
+    "extract_scores": setup_extract_scores,
+    "extract_scores_corpus": setup_extract_scores_corpus,
+    "extract_scores_synth": setup_extract_scores_synth,
+    "extract_scores_synth_vector": setup_extract_scores_synth_vector,
+    "document_combined": setup_parse_document_combined,
+    "document_combined_serial": setup_parse_document_combined_serial
+}
+
+
+# ------------------------------------------------
+# MEASURE ONE STAGE (runs in its own process)
+# ------------------------------------------------
+def peak_rss_mb():
+
+    # ru_maxrss is KiB on Linux; children covers pdftoppm
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    return max(own, children) / 1024
+
+
+def measure(run, min_runs, min_seconds, warmup):
+
+    for _ in range(warmup):
+        run()
+
+    timings = []
+    start = time.perf_counter()
+
+    while len(timings) < min_runs or time.perf_counter() - start < min_seconds:
+
+        t = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - t)
+
+    return timings
+
+
+def run_stage(name, pdf_path, min_runs, min_seconds, warmup):
+
+    with open(pdf_path, "rb") as f:
+        pdf_bytes = f.read()
+
+    try:
+        run = STAGES[name](pdf_bytes)
+        rss_before = peak_rss_mb()
+        timings = measure(run, min_runs, min_seconds, warmup)
+    except Exception as e:
+        # e.g. poppler missing for the rendering stages
+        return {"stage": name, "error": f"{type(e).__name__}: {e}"}
+
+    rss_after = peak_rss_mb()
+
+    ms = sorted(t * 1000 for t in timings)
+
+    return {
+        "stage": name,
+        "runs": len(ms),
+        "median_ms": round(statistics.median(ms), 4),
+        "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 4),
+        "mean_ms": round(statistics.fmean(ms), 4),
+        "throughput_per_s": round(1000 / statistics.fmean(ms), 2),
+        "peak_rss_mb": round(rss_after, 1),
+        "stage_rss_mb": round(rss_after - rss_before, 1)
+    }
+
+
+# ------------------------------------------------
+# RESULTS AND BASELINE
+# ------------------------------------------------
+def environment():
+
+    import cv2
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+
+
+def compare(results, baseline, threshold):
+
+    base = {s["stage"]: s for s in baseline["stages"] if "median_ms" in s}
+
+    regressions = []
+
+    print(f"\n{'stage':28s} {'baseline':>12s} {'current':>12s} {'change':>8s}")
+
+    for stage in results["stages"]:
+
+        old = base.get(stage["stage"])
+
+        if old is None or "median_ms" not in stage:
+            continue
+
+        change = stage["median_ms"] / old["median_ms"] - 1
+
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(stage["stage"])
+
+        print(
+            f"{stage['stage']:28s} {old['median_ms']:10.3f}ms"
+            f" {stage['median_ms']:10.3f}ms {change:+8.1%}{flag}"
+        )
+
+    return regressions
+
+
+def print_results(results):
+
+    print(f"{'stage':28s} {'median':>11s} {'p95':>11s} {'ops/s':>10s} {'peak rss':>10s}")
+
+    for s in results["stages"]:
+
+        if "error" in s:
+            print(f"{s['stage']:28s} skipped: {s['error']}")
+            continue
+
+        print(
+            f"{s['stage']:28s} {s['median_ms']:9.3f}ms {s['p95_ms']:9.3f}ms"
+            f" {s['throughput_per_s']:10.1f} {s['peak_rss_mb']:8.1f}MB"
+        )
+
+
+# ------------------------------------------------
+# DRIVER
+# ------------------------------------------------
+def main():
+
+    parser = argparse.ArgumentParser(description="Benchmark the parsing pipeline")
+    parser.add_argument("pdf", nargs="?", default=DEFAULT_PDF)
+    parser.add_argument("--stages", nargs="+", choices=sorted(STAGES), default=list(STAGES))
+    parser.add_argument("--min-runs", type=int, default=20)
+    parser.add_argument("--min-seconds", type=float, default=1.0)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--output", default=DEFAULT_RESULT)
+    parser.add_argument("--baseline", help="result file to compare against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--stage", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stage:
+        print(json.dumps(run_stage(
+            args.stage, args.pdf, args.min_runs, args.min_seconds, args.warmup
+        )))
+        return
+
+    stages = []
+
+    # a fresh interpreter per stage keeps peak RSS attributable
+    for name in args.stages:
+
+        out = subprocess.run(
+            [
+                sys.executable, "-m", "benchmarks.suite", args.pdf,
+                "--stage", name,
+                "--min-runs", str(args.min_runs),
+                "--min-seconds", str(args.min_seconds),
+                "--warmup", str(args.warmup)
+            ],
+            capture_output=True,
+            text=True
+        )
+
+        if out.returncode != 0:
+            lines = out.stderr.strip().splitlines() or ["failed"]
+            stages.append({"stage": name, "error": lines[-1]})
+            continue
+
+        stages.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    results = {
+        "environment": environment(),
+        "pdf": args.pdf,
+        "stages": stages
+    }
+
+    print_results(results)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\nwrote {args.output}")
+
+    if args.baseline:
+
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+import argparse
+import colorsys
+import io
+import json
+import os
+
+import cv2
+import numpy as np
+
+from parser.extract import BAR_CLIP, DISEASES
+from parser.render import SCORE_PAGE_INDEX
+
+# US Letter, points
+PAGE_W = 612
+PAGE_H = 792
+
+RISKS = ["yellow", "orange", "red"]
+
+# HSV value ranges per risk, kept clear of the classifier's 120 / 175
+# cut-offs so jitter and noise cannot flip the ground truth
+VALUE_RANGE = {
+    "red": (0.25, 0.40),
+    "orange": (0.54, 0.63),
+    "yellow": (0.78, 0.97)
+}
+
+# Grey track the coloured bar sits on, as in the real report
+TRACK_WIDTH = 200 * 72 / 200
+
+# Text layer of a real export: patient on the cover, title on the score page
+COVER_TEXT = "First/Last Name: {patient}"
+SCORE_TEXT = "Diseases and disorder screening modeling"
+
+
+# ------------------------------------------------
+# GEOMETRY (points)
+# ------------------------------------------------
+def row_boxes():
+
+    # 25 evenly spaced bars inside the parser's scan range
+    x, y, w, h = BAR_CLIP
+
+    pitch = h / len(DISEASES)
+    bar_h = pitch * 0.52
+
+    boxes = []
+
+    for i in range(len(DISEASES)):
+        top = y + i * pitch + (pitch - bar_h) / 2
+        boxes.append((x, top, bar_h))
+
+    return boxes
+
+
+def bar_rgb(rng, risk):
+
+    hue = rng.uniform(0.50, 0.62)
+    sat = rng.uniform(0.55, 0.85)
+    val = rng.uniform(*VALUE_RANGE[risk])
+
+    return colorsys.hsv_to_rgb(hue, sat, val)
+
+
+def random_scores(rng):
+
+    return {d: RISKS[rng.integers(len(RISKS))] for d in DISEASES}
+
+
+# ------------------------------------------------
+# RASTER PAGES
+# ------------------------------------------------
+def pt(v, dpi):
+
+    return int(round(v * dpi / 72))
+
+
+def filler_page(rng, dpi):
+
+    page = np.full((pt(PAGE_H, dpi), pt(PAGE_W, dpi), 3), 255, np.uint8)
+
+    # a few grey text-like blocks so filler pages are not empty
+    for _ in range(int(rng.integers(5, 20))):
+        x = pt(rng.uniform(40, 400), dpi)
+        y = pt(rng.uniform(40, 740), dpi)
+        w = pt(rng.uniform(40, 160), dpi)
+        cv2.rectangle(page, (x, y), (x + w, y + pt(6, dpi)), (90, 90, 90), -1)
+
+    return page
+
+
+def score_page(rng, scores, dpi, noise, diseases=DISEASES):
+
+    # diseases: the rows this page shows, from the top of the table
+    page = filler_page(rng, dpi)
+
+    bar_w = BAR_CLIP[2]
+
+    for (x, top, h), disease in zip(row_boxes(), diseases):
+
+        y1, y2 = pt(top, dpi), pt(top + h, dpi)
+
+        cv2.rectangle(
+            page,
+            (pt(x, dpi), y1),
+            (pt(x + TRACK_WIDTH, dpi), y2),
+            (128, 128, 128),
+            -1
+        )
+
+        # fill covers at least the sampled column
+        fill_w = rng.uniform(bar_w * 1.5, TRACK_WIDTH)
+        rgb = [int(round(c * 255)) for c in bar_rgb(rng, scores[disease])]
+
+        cv2.rectangle(page, (pt(x, dpi), y1), (pt(x + fill_w, dpi), y2), rgb, -1)
+
+    if noise > 0:
+        page = np.clip(page + rng.normal(0, noise, page.shape), 0, 255).astype(np.uint8)
+
+    return page
+
+
+def raster_pdf(pages, dpi):
+
+    from PIL import Image
+
+    images = [Image.fromarray(p) for p in pages]
+
+    buf = io.BytesIO()
+
+    images[0].save(
+        buf,
+        format="PDF",
+        save_all=True,
+        append_images=images[1:],
+        resolution=dpi
+    )
+
+    return buf.getvalue()
+
+
+# ------------------------------------------------
+# TEXT LAYER AND VECTOR PAGES (optional, need PyMuPDF)
+# ------------------------------------------------
+def page_text(i, tables, patient):
+
+    if i in tables:
+        return SCORE_TEXT
+
+    if i == 0 and patient is not None:
+        return COVER_TEXT.format(patient=patient)
+
+    return f"Page {i + 1}"
+
+
+def scanned_pdf(pages, tables, patient):
+
+    # raster pages with an invisible text layer, like an OCRed scan
+    import pymupdf
+
+    doc = pymupdf.open()
+
+    for i, pixels in enumerate(pages):
+
+        page = doc.new_page(width=PAGE_W, height=PAGE_H)
+
+        _, png = cv2.imencode(".png", pixels[:, :, ::-1])
+
+        page.insert_image(page.rect, stream=png.tobytes())
+        page.insert_text((36, 24), page_text(i, tables, patient), render_mode=3)
+
+    return doc.tobytes()
+
+
+def vector_pdf(rng, scores, page_count, tables, patient=None):
+
+    import pymupdf
+
+    doc = pymupdf.open()
+
+    for i in range(page_count):
+
+        page = doc.new_page(width=PAGE_W, height=PAGE_H)
+
+        page.insert_text((36, 24), page_text(i, tables, patient))
+
+        if i not in tables:
+            continue
+
+        for (x, top, h), disease in zip(row_boxes(), tables[i]):
+
+            page.draw_rect(
+                pymupdf.Rect(x, top, x + TRACK_WIDTH, top + h),
+                color=None,
+                fill=(0.5, 0.5, 0.5)
+            )
+
+            fill_w = rng.uniform(BAR_CLIP[2] * 1.5, TRACK_WIDTH)
+
+            page.draw_rect(
+                pymupdf.Rect(x, top, x + fill_w, top + h),
+                color=None,
+                fill=bar_rgb(rng, scores[disease])
+            )
+
+    return doc.tobytes()
+
+
+# ------------------------------------------------
+# REPORTS
+# ------------------------------------------------
+def generate_report(rng, min_pages=2, max_pages=6, dpis=(150, 200, 300),
+                    noise=3.0, vector=False, patient=None, continued=False):
+
+    # patient: name for the text layer; None keeps raster reports
+    # text-free like a plain scan. continued: the table breaks after a
+    # random row and continues at the top of the next page.
+    scores = random_scores(rng)
+
+    # score page index -> diseases it shows
+    tables = {SCORE_PAGE_INDEX: DISEASES}
+
+    if continued:
+        split = int(rng.integers(8, len(DISEASES) - 5))
+        tables = {
+            SCORE_PAGE_INDEX: DISEASES[:split],
+            SCORE_PAGE_INDEX + 1: DISEASES[split:]
+        }
+
+    page_count = int(rng.integers(max(min_pages, max(tables) + 1), max_pages + 1))
+
+    truth = {
+        "scores": scores,
+        "score_page": SCORE_PAGE_INDEX,
+        "score_pages": sorted(tables),
+        "pages": page_count,
+        "patient": patient
+    }
+
+    if vector:
+        truth["kind"] = "vector"
+        return vector_pdf(rng, scores, page_count, tables, patient), truth
+
+    dpi = int(rng.choice(dpis))
+
+    pages = [
+        score_page(rng, scores, dpi, noise, tables[i]) if i in tables
+        else filler_page(rng, dpi)
+        for i in range(page_count)
+    ]
+
+    truth["kind"] = "raster"
+    truth["dpi"] = dpi
+    truth["noise"] = noise
+
+    # a continued table is only found through the text layer
+    if patient is not None or continued:
+        return scanned_pdf(pages, tables, patient), truth
+
+    return raster_pdf(pages, dpi), truth
+
+
+def generate_combined(rng, patients, **kwargs):
+
+    # one export holding several patients' reports back to back
+    import pymupdf
+
+    combined = pymupdf.open()
+    truths = []
+
+    for i in range(patients):
+
+        pdf_bytes, truth = generate_report(rng, patient=f"Patient {i + 1:03d}", **kwargs)
+
+        with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+            combined.insert_pdf(doc)
+
+        truths.append(truth)
+
+    return combined.tobytes(), truths
+
+
+def generate_corpus(count, seed=0, vector_fraction=0.0, continued_fraction=0.0, **kwargs):
+
+    rng = np.random.default_rng(seed)
+
+    for _ in range(count):
+
+        vector = rng.random() < vector_fraction
+
+        # drawn only when asked for, so existing seeds keep their corpus
+        continued = continued_fraction > 0 and rng.random() < continued_fraction
+
+        yield generate_report(rng, vector=vector, continued=continued, **kwargs)
+
+
+def write_corpus(directory, count, seed=0, **kwargs):
+
+    os.makedirs(directory, exist_ok=True)
+
+    for i, (pdf_bytes, truth) in enumerate(generate_corpus(count, seed=seed, **kwargs)):
+
+        stem = os.path.join(directory, f"report_{i:05d}")
+
+        with open(stem + ".pdf", "wb") as f:
+            f.write(pdf_bytes)
+
+        with open(stem + ".json", "w") as f:
+            json.dump(truth, f, indent=2)
+
+
+def load_corpus(directory):
+
+    for name in sorted(os.listdir(directory)):
+
+        if not name.endswith(".pdf"):
+            continue
+
+        stem = os.path.join(directory, name[:-4])
+
+        with open(stem + ".pdf", "rb") as f:
+            pdf_bytes = f.read()
+
+        with open(stem + ".json") as f:
+            truth = json.load(f)
+
+        yield name, pdf_bytes, truth
+
+
+# ------------------------------------------------
+# CORRECTNESS CHECK
+# ------------------------------------------------
+def check_corpus(directory):
+
+    from parser.document import parse_document
+
+    reports = 0
+    wrong_reports = 0
+    rows = 0
+    wrong_rows = 0
+
+    for name, pdf_bytes, truth in load_corpus(directory):
+
+        scores = parse_document(pdf_bytes)["scores"]
+
+        wrong = [d for d, risk in truth["scores"].items() if scores.get(d) != risk]
+
+        reports += 1
+        rows += len(truth["scores"])
+        wrong_rows += len(wrong)
+
+        if wrong:
+            wrong_reports += 1
+            print(f"{name}: {len(wrong)} wrong ({', '.join(wrong[:3])}...)")
+
+    print(
+        f"{reports - wrong_reports}/{reports} reports exact, "
+        f"{rows - wrong_rows}/{rows} rows correct"
+    )
+
+    return wrong_reports == 0
+
+
+# ------------------------------------------------
+# DRIVER
+# ------------------------------------------------
+def main():
+
+    parser = argparse.ArgumentParser(description="Synthetic Bio Scan reports")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("generate", help="write PDFs with ground-truth JSON")
+    gen.add_argument("directory")
+    gen.add_argument("--count", type=int, default=100)
+    gen.add_argument("--seed", type=int, default=0)
+    gen.add_argument("--min-pages", type=int, default=2)
+    gen.add_argument("--max-pages", type=int, default=6)
+    gen.add_argument("--dpi", type=int, nargs="+", default=[150, 200, 300])
+    gen.add_argument("--noise", type=float, default=3.0)
+    gen.add_argument("--vector-fraction", type=float, default=0.0)
+    gen.add_argument("--continued-fraction", type=float, default=0.0,
+                     help="share of reports whose table continues on a second page")
+
+    chk = sub.add_parser("check", help="parse a corpus and compare to ground truth")
+    chk.add_argument("directory")
+
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        write_corpus(
+            args.directory,
+            args.count,
+            seed=args.seed,
+            vector_fraction=args.vector_fraction,
+            continued_fraction=args.continued_fraction,
+            min_pages=args.min_pages,
+            max_pages=args.max_pages,
+            dpis=args.dpi,
+            noise=args.noise
+        )
+        return
+
+    if not check_corpus(args.directory):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import gc
+import os
+
+from parser.cpus import CPUS, worker_cpus
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 10000)}"
+
+# Import app.py (and with it cv2, numpy, pdfplumber and the parser modules)
+# once in the master; forked workers share those pages copy-on-write
+preload_app = True
+
+# Parsing is CPU-bound: one process per CPU
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", CPUS))
+
+# Exported before the app is preloaded: the per-process batch and page
+# pools split the CPUs across workers (parser.cpus.worker_cpus) instead
+# of each claiming all of them
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+# Two request threads per CPU of the worker's share: one parses while the
+# other waits on pdftoppm or request I/O; more would only queue behind the
+# CPU. The batch and page pools are per process, not per thread, and the
+# JOB_WORKERS job threads parse in this process too, so none of them grow
+# with this setting.
+threads = int(os.environ.get("GUNICORN_THREADS", 2 * worker_cpus()))
+
+# Recycle workers to contain memory growth from rendering; jitter keeps
+# them from all restarting at once
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 500))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 50))
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+
+
+def on_starting(server):
+
+    # workers share one metrics directory; snapshots of a previous run
+    # would be added to this one's
+    from parser import metrics
+
+    metrics.enable_directory()
+    metrics.reset_directory()
+
+
+def pre_fork(server, worker):
+
+    # move preloaded objects out of the collector's generations so gc in
+    # the workers does not touch (and copy) the shared pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+
+    # threads do not survive fork; start this worker's job threads
+    import sqlite3
+
+    from parser import jobs
+
+    try:
+        jobs.ensure_workers()
+    except sqlite3.Error as e:
+        # the worker still serves parsing; /jobs retries and reports 503
+        server.log.warning("job queue unavailable: %s", e)
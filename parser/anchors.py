@@ -1,26 +1,145 @@
+import os
+
 import cv2
 import numpy as np
 
-def detect_all_anchors(img):
+from parser.page_buffer import to_gray
 
-    h, w = img.shape[:2]
+# "full": Canny over the whole page
+# "coarse": downscaled search in the band, refined at full resolution
+ANCHOR_MODE = os.environ.get("ANCHOR_MODE", "full")
+
+# Horizontal band searched for the risk bar column, as width fractions
+SCAN_START = 0.45
+SCAN_END = 0.75
+
+COARSE_SCALE = 0.25
+
+# Separate coarse peaks refined at full resolution; the bar edge and the
+# label column edge can be close in strength
+COARSE_CANDIDATES = 4
+
+# Full-resolution pixels either side of a coarse peak to refine
+REFINE_RADIUS = 12
 
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+# Extra pixels around a crop so blur and Canny see the same
+# neighbourhood as on the full page
+EDGE_MARGIN = 8
+
+
+def edge_map(gray):
 
     blur = cv2.GaussianBlur(gray, (5,5), 0)
 
-    edges = cv2.Canny(blur, 50, 150)
+    return cv2.Canny(blur, 50, 150)
+
+
+def column_strength(img, x1, x2):
+
+    # edge sum per column for img[:, x1:x2], computed on a crop
+    w = img.shape[1]
+
+    c1 = max(0, x1 - EDGE_MARGIN)
+    c2 = min(w, x2 + EDGE_MARGIN)
 
-    scan_start = int(w * 0.45)
-    scan_end = int(w * 0.75)
+    gray = to_gray(img[:, c1:c2])
+
+    edges = edge_map(gray)[:, x1 - c1:x2 - c1]
+
+    return np.sum(edges, axis=0, dtype=np.int64)
+
+
+def find_risk_bar_x(img):
+
+    w = img.shape[1]
+
+    scan_start = int(w * SCAN_START)
+    scan_end = int(w * SCAN_END)
+
+    gray = to_gray(img)
+
+    edges = edge_map(gray)
 
     roi = edges[:, scan_start:scan_end]
 
-    column_strength = np.sum(roi, axis=0)
+    strength = np.sum(roi, axis=0)
+
+    return scan_start + int(np.argmax(strength))
+
+
+def find_risk_bar_x_coarse(img):
+
+    w = img.shape[1]
 
-    peak_column = int(np.argmax(column_strength))
+    scan_start = int(w * SCAN_START)
+    scan_end = int(w * SCAN_END)
+
+    # coarse pass: band only, downscaled
+    c1 = max(0, scan_start - EDGE_MARGIN)
+    c2 = min(w, scan_end + EDGE_MARGIN)
+
+    band = to_gray(img[:, c1:c2])
+
+    small = cv2.resize(
+        band,
+        None,
+        fx=COARSE_SCALE,
+        fy=COARSE_SCALE,
+        interpolation=cv2.INTER_AREA
+    )
+
+    coarse = np.sum(edge_map(small), axis=0, dtype=np.int64)
+
+    # strongest coarse columns, at most one per refine window
+    spacing = REFINE_RADIUS * COARSE_SCALE
+
+    peaks = []
+
+    for peak in np.argsort(coarse, kind="stable")[::-1]:
+
+        if all(abs(peak - p) > spacing for p in peaks):
+            peaks.append(peak)
+
+        if len(peaks) == COARSE_CANDIDATES:
+            break
+
+    # fine pass: full resolution in a narrow window around each peak
+    best_x = None
+    best_strength = -1
+
+    for peak in peaks:
+
+        centre = c1 + int((peak + 0.5) / COARSE_SCALE)
+
+        x1 = max(scan_start, centre - REFINE_RADIUS)
+        x2 = min(scan_end, centre + REFINE_RADIUS + 1)
+
+        if x1 >= x2:
+            continue
+
+        strength = column_strength(img, x1, x2)
+
+        i = int(np.argmax(strength))
+
+        if strength[i] > best_strength:
+            best_x, best_strength = x1 + i, strength[i]
+
+    if best_x is None:
+        return find_risk_bar_x(img)
+
+    return best_x
+
+
+def detect_all_anchors(img, mode=None):
+
+    mode = mode or ANCHOR_MODE
+
+    h, w = img.shape[:2]
 
-    risk_bar_x = scan_start + peak_column
+    if mode == "coarse":
+        risk_bar_x = find_risk_bar_x_coarse(img)
+    else:
+        risk_bar_x = find_risk_bar_x(img)
 
     risk_bar_width = int(w * 0.14)
 
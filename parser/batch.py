@@ -0,0 +1,229 @@
+import io
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from parser.cache import result_cache
+from parser.cpus import worker_cpus
+from parser.document import parse_document
+
+# Parse processes per web worker; by default the worker's CPU share, so
+# all workers together run one parse process per available CPU
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", worker_cpus()))
+
+# Limits per /parse-reports request
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", 500))
+BATCH_MAX_BYTES = int(os.environ.get("BATCH_MAX_BYTES", 512 * 1024 * 1024))
+
+ZIP_MAGIC = b"PK\x03\x04"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Submitted tasks not yet finished (queued or running)
+_pool_pending = 0
+
+
+# ------------------------------------------------
+# PROCESS POOL
+# ------------------------------------------------
+def get_pool():
+
+    global _pool
+
+    with _pool_lock:
+
+        if _pool is None:
+
+            # forkserver: never fork the threaded web worker itself
+            _pool = ProcessPoolExecutor(
+                max_workers=BATCH_WORKERS,
+                mp_context=multiprocessing.get_context("forkserver"),
+                initializer=_init_child
+            )
+
+        return _pool
+
+
+def _init_child():
+
+    # the pool already has a process per CPU; pages of one document are
+    # parsed in turn rather than on a thread pool of their own
+    from parser import document
+
+    document.PAGE_WORKERS = 1
+
+
+def submit(fn, *args):
+
+    global _pool_pending
+
+    # counted before submitting so a fast task cannot finish first
+    with _pool_lock:
+        _pool_pending += 1
+
+    try:
+        future = get_pool().submit(fn, *args)
+    except Exception:
+        _task_done(None)
+        raise
+
+    future.add_done_callback(_task_done)
+
+    return future
+
+
+def _task_done(future):
+
+    global _pool_pending
+
+    with _pool_lock:
+        _pool_pending -= 1
+
+
+def pool_stats():
+
+    with _pool_lock:
+
+        return {
+            "workers": BATCH_WORKERS,
+            "running": int(_pool is not None),
+            "pending": _pool_pending
+        }
+
+
+def shutdown_pool():
+
+    global _pool
+
+    with _pool_lock:
+
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+# ------------------------------------------------
+# COLLECT UPLOADS
+# ------------------------------------------------
+def unique_name(name, named):
+
+    if name not in named:
+        return name
+
+    n = 2
+    while f"{name} ({n})" in named:
+        n += 1
+
+    return f"{name} ({n})"
+
+
+def collect_pdfs(uploads):
+
+    # uploads: (filename, bytes) pairs, each a PDF or a zip of PDFs
+    named = {}
+    total = 0
+
+    for filename, data in uploads:
+
+        if data.startswith(ZIP_MAGIC):
+            entries = read_zip(data)
+        else:
+            entries = [(filename, data)]
+
+        for name, pdf_bytes in entries:
+
+            total += len(pdf_bytes)
+
+            if len(named) >= BATCH_MAX_FILES:
+                raise ValueError(f"more than {BATCH_MAX_FILES} files")
+
+            if total > BATCH_MAX_BYTES:
+                raise ValueError(f"batch larger than {BATCH_MAX_BYTES} bytes")
+
+            named[unique_name(name, named)] = pdf_bytes
+
+    return named
+
+
+def read_zip(data):
+
+    entries = []
+
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile:
+        raise ValueError("invalid zip archive")
+
+    with archive:
+
+        total = 0
+
+        for info in archive.infolist():
+
+            if info.is_dir() or not info.filename.lower().endswith(".pdf"):
+                continue
+
+            # check declared sizes before inflating anything
+            total += info.file_size
+
+            if total > BATCH_MAX_BYTES:
+                raise ValueError(f"batch larger than {BATCH_MAX_BYTES} bytes")
+
+            entries.append((info.filename, archive.read(info)))
+
+    return entries
+
+
+# ------------------------------------------------
+# PARSE
+# ------------------------------------------------
+def parse_one(pdf_bytes):
+
+    # runs in a pool process; errors come back as data, not exceptions
+    try:
+        return {"result": parse_document(pdf_bytes)}
+    except Exception as e:
+        return {"error": "parser_failure", "message": str(e)}
+
+
+def parse_many(named):
+
+    results = {}
+    errors = {}
+
+    pending = {}
+
+    for name, pdf_bytes in named.items():
+
+        key = result_cache.key(pdf_bytes, "scores")
+
+        cached = result_cache.get(key)
+
+        if cached is not None:
+            results[name] = cached
+            continue
+
+        pending[name] = (key, submit(parse_one, pdf_bytes))
+
+    for name, (key, future) in pending.items():
+
+        try:
+            outcome = future.result()
+        except BrokenProcessPool as e:
+            # a worker died (e.g. OOM); start a fresh pool next time
+            shutdown_pool()
+            outcome = {"error": "worker_failure", "message": str(e)}
+        except Exception as e:
+            outcome = {"error": "worker_failure", "message": str(e)}
+
+        if "result" in outcome:
+            result_cache.put(key, outcome["result"])
+            results[name] = outcome["result"]
+        else:
+            errors[name] = outcome
+
+    return results, errors
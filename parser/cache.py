@@ -0,0 +1,231 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from parser import disk_store
+from parser.document import DOCUMENT_VERSION
+from parser.extract import ENGINE_NAME
+from parser.vector_extract import ENGINE_NAME as VECTOR_ENGINE_NAME
+
+# Shared by all workers on the host; empty disables the disk tier
+CACHE_DIR = os.environ.get("CACHE_DIR", "/tmp/ithrive-cache")
+
+# Per-process LRU size (entries); 0 disables the memory tier
+CACHE_MEMORY_ITEMS = int(os.environ.get("CACHE_MEMORY_ITEMS", 256))
+
+# Per-process LRU budget in bytes; debug overlays run to a megabyte each,
+# so the entry count alone does not bound a worker's memory
+CACHE_MEMORY_BYTES = int(os.environ.get("CACHE_MEMORY_BYTES", 32 * 1024 * 1024))
+
+# Disk tier budget in bytes
+CACHE_DISK_BYTES = int(os.environ.get("CACHE_DISK_BYTES", 256 * 1024 * 1024))
+
+# Part of every key, so an engine bump never serves old results
+CACHE_VERSION = f"{ENGINE_NAME}+{VECTOR_ENGINE_NAME}+{DOCUMENT_VERSION}"
+
+KIND_SUFFIX = {
+    "json": ".json",
+    "bytes": ".bin"
+}
+
+
+class ResultCache:
+
+    def __init__(self, directory=CACHE_DIR, memory_items=CACHE_MEMORY_ITEMS,
+                 disk_bytes=CACHE_DISK_BYTES, version=CACHE_VERSION,
+                 memory_bytes=CACHE_MEMORY_BYTES):
+
+        self.directory = directory
+        self.memory_items = memory_items
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.version = version
+
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()
+        self.memory_used = 0
+
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0
+        }
+
+        self.disk_used = None
+
+    # ------------------------------------------------
+    # KEYS AND ENCODING
+    # ------------------------------------------------
+    def key(self, pdf_bytes, variant=""):
+
+        h = hashlib.sha256()
+        h.update(f"{self.version}\0{variant}\0".encode())
+        h.update(pdf_bytes)
+
+        return h.hexdigest()
+
+    @staticmethod
+    def encode(value):
+
+        if isinstance(value, (bytes, bytearray)):
+            return "bytes", bytes(value)
+
+        return "json", json.dumps(value).encode()
+
+    @staticmethod
+    def decode(kind, data):
+
+        if kind == "bytes":
+            return data
+
+        return json.loads(data)
+
+    def path(self, key, kind):
+
+        return os.path.join(self.directory, key + KIND_SUFFIX[kind])
+
+    # ------------------------------------------------
+    # LOOKUP
+    # ------------------------------------------------
+    def get(self, key):
+
+        with self.lock:
+
+            entry = self.memory.get(key)
+
+            if entry is not None:
+                self.memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return self.decode(*entry)
+
+        entry = self.read_disk(key)
+
+        with self.lock:
+
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+
+            self.counters["disk_hits"] += 1
+            self.remember(key, entry)
+
+        return self.decode(*entry)
+
+    def read_disk(self, key):
+
+        if not self.directory:
+            return None
+
+        for kind in KIND_SUFFIX:
+
+            path = self.path(key, kind)
+
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                continue
+
+            # mtime doubles as last-use time for disk eviction
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+            return kind, data
+
+        return None
+
+    # ------------------------------------------------
+    # STORE
+    # ------------------------------------------------
+    def put(self, key, value):
+
+        entry = self.encode(value)
+
+        with self.lock:
+            self.remember(key, entry)
+            self.counters["stores"] += 1
+
+        self.write_disk(key, entry)
+
+    def remember(self, key, entry):
+
+        size = len(entry[1])
+
+        # too big for the budget on its own: leave it to the disk tier
+        if self.memory_items <= 0 or size > self.memory_bytes:
+            return
+
+        old = self.memory.pop(key, None)
+
+        if old is not None:
+            self.memory_used -= len(old[1])
+
+        self.memory[key] = entry
+        self.memory_used += size
+
+        while (
+            len(self.memory) > self.memory_items
+            or self.memory_used > self.memory_bytes
+        ):
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_used -= len(evicted[1])
+            self.counters["memory_evictions"] += 1
+
+    def write_disk(self, key, entry):
+
+        if not self.directory:
+            return
+
+        kind, data = entry
+
+        if not disk_store.write_atomic(self.directory, self.path(key, kind), data):
+            return
+
+        with self.lock:
+
+            if self.disk_used is None:
+                self.disk_used = disk_store.usage(self.directory, KIND_SUFFIX.values())
+            else:
+                self.disk_used += len(data)
+
+            over = self.disk_used > self.disk_bytes
+
+        if over:
+            self.evict_disk()
+
+    # ------------------------------------------------
+    # DISK EVICTION
+    # ------------------------------------------------
+    def evict_disk(self):
+
+        used, _, evicted = disk_store.sweep(
+            self.directory, KIND_SUFFIX.values(), self.disk_bytes
+        )
+
+        with self.lock:
+            self.disk_used = used
+            self.counters["disk_evictions"] += evicted
+
+    # ------------------------------------------------
+    # STATS
+    # ------------------------------------------------
+    def stats(self):
+
+        with self.lock:
+
+            stats = dict(self.counters)
+            stats["memory_items"] = len(self.memory)
+            stats["memory_bytes"] = self.memory_used
+            stats["disk_bytes"] = self.disk_used or 0
+
+        return stats
+
+
+result_cache = ResultCache()
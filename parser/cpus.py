@@ -0,0 +1,44 @@
+import math
+import os
+
+
+def available_cpus():
+
+    # CPUs this container may actually use: affinity mask, then any
+    # cgroup v2 / v1 quota
+    cpus = len(os.sched_getaffinity(0))
+
+    quota = None
+
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            limit, period = f.read().split()
+            if limit != "max":
+                quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                limit = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = int(f.read())
+            if limit > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+
+    return cpus
+
+
+CPUS = available_cpus()
+
+
+def worker_cpus():
+
+    # this process's share of the CPUs: gunicorn.conf.py exports the
+    # worker count, a single dev server gets them all
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+
+    return max(1, CPUS // max(1, workers))
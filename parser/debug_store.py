@@ -0,0 +1,173 @@
+import hashlib
+import os
+import re
+import threading
+import time
+
+from parser import disk_store
+
+# Shared by all workers on the host
+DEBUG_STORE_DIR = os.environ.get("DEBUG_STORE_DIR", "/tmp/ithrive-debug")
+
+# Seconds an artifact stays downloadable after its last store
+DEBUG_STORE_TTL = float(os.environ.get("DEBUG_STORE_TTL", 3600))
+
+# Total budget in bytes; the oldest artifacts go first
+DEBUG_STORE_BYTES = int(os.environ.get("DEBUG_STORE_BYTES", 64 * 1024 * 1024))
+
+# Artifact ids: leading hex of the content's sha256
+ID_LENGTH = 32
+ID_PATTERN = re.compile(rf"^[0-9a-f]{{{ID_LENGTH}}}$")
+
+# mimetype -> file suffix, so a lookup by id recovers the mimetype
+SUFFIXES = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/webp": ".webp"
+}
+
+
+class DebugStore:
+
+    def __init__(self, directory=DEBUG_STORE_DIR, ttl=DEBUG_STORE_TTL,
+                 max_bytes=DEBUG_STORE_BYTES):
+
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        self.lock = threading.Lock()
+
+        self.counters = {
+            "stores": 0,
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "evictions": 0
+        }
+
+        self.used = None
+        self.last_sweep = 0.0
+
+    # ------------------------------------------------
+    # PATHS
+    # ------------------------------------------------
+    @staticmethod
+    def artifact_id(data):
+
+        return hashlib.sha256(data).hexdigest()[:ID_LENGTH]
+
+    def path(self, artifact_id, mimetype):
+
+        return os.path.join(self.directory, artifact_id + SUFFIXES[mimetype])
+
+    # ------------------------------------------------
+    # STORE
+    # ------------------------------------------------
+    def put(self, data, mimetype):
+
+        # the artifact's id, or None when it could not be stored
+        artifact_id = self.artifact_id(data)
+        path = self.path(artifact_id, mimetype)
+
+        # same content, same id: a repeat only restarts its TTL
+        try:
+            os.utime(path)
+            stored = False
+        except OSError:
+            if not disk_store.write_atomic(self.directory, path, data):
+                return None
+
+            stored = True
+
+        now = time.time()
+
+        with self.lock:
+
+            if stored:
+                self.counters["stores"] += 1
+
+                if self.used is not None:
+                    self.used += len(data)
+
+            sweep = (
+                self.used is None
+                or self.used > self.max_bytes
+                or now - self.last_sweep > self.ttl / 10
+            )
+
+            if sweep:
+                self.last_sweep = now
+
+        if sweep:
+            self.sweep()
+
+        return artifact_id
+
+    # ------------------------------------------------
+    # LOOKUP
+    # ------------------------------------------------
+    def get(self, artifact_id):
+
+        # (bytes, mimetype), or None when unknown, expired or evicted
+        if not ID_PATTERN.match(artifact_id):
+            return None
+
+        for mimetype in SUFFIXES:
+
+            path = self.path(artifact_id, mimetype)
+
+            try:
+                with open(path, "rb") as f:
+                    st = os.fstat(f.fileno())
+                    data = f.read()
+            except OSError:
+                continue
+
+            if time.time() - st.st_mtime > self.ttl:
+                disk_store.remove(path)
+
+                with self.lock:
+                    self.counters["expired"] += 1
+                    self.counters["misses"] += 1
+
+                return None
+
+            with self.lock:
+                self.counters["hits"] += 1
+
+            return data, mimetype
+
+        with self.lock:
+            self.counters["misses"] += 1
+
+        return None
+
+    # ------------------------------------------------
+    # EVICTION
+    # ------------------------------------------------
+    def sweep(self):
+
+        used, expired, evicted = disk_store.sweep(
+            self.directory, SUFFIXES.values(), self.max_bytes, ttl=self.ttl
+        )
+
+        with self.lock:
+            self.used = used
+            self.counters["expired"] += expired
+            self.counters["evictions"] += evicted
+
+    # ------------------------------------------------
+    # STATS
+    # ------------------------------------------------
+    def stats(self):
+
+        with self.lock:
+
+            stats = dict(self.counters)
+            stats["bytes"] = self.used or 0
+
+        return stats
+
+
+debug_store = DebugStore()
@@ -0,0 +1,122 @@
+import os
+import tempfile
+import time
+
+# Suffix of files still being written
+TMP_SUFFIX = ".tmp"
+
+# A temp file this old belongs to a writer that died before its rename
+STALE_TMP_SECONDS = 300
+
+
+# ------------------------------------------------
+# WRITE
+# ------------------------------------------------
+def remove(path):
+
+    try:
+        os.remove(path)
+    except OSError:
+        return False
+
+    return True
+
+
+def write_atomic(directory, path, data):
+
+    # write then rename so other workers never read a partial file;
+    # False when the write failed, with nothing left behind
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=TMP_SUFFIX)
+    except OSError:
+        return False
+
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+
+        os.replace(tmp, path)
+
+    except OSError:
+        remove(tmp)
+        return False
+
+    return True
+
+
+# ------------------------------------------------
+# BUDGETED DIRECTORY
+# ------------------------------------------------
+def entries(directory, suffixes):
+
+    # [(mtime, size, path)] for every file ending in one of suffixes
+    entries = []
+
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return entries
+
+    for name in names:
+
+        if not name.endswith(tuple(suffixes)):
+            continue
+
+        path = os.path.join(directory, name)
+
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+
+        entries.append((st.st_mtime, st.st_size, path))
+
+    return entries
+
+
+def usage(directory, suffixes):
+
+    return sum(size for _, size, _ in entries(directory, suffixes))
+
+
+def sweep(directory, suffixes, max_bytes, ttl=None):
+
+    # other workers write here too, so rescan rather than trust a
+    # process's running total. Drops entries unused for ttl seconds,
+    # then the least recently used down to 90% of max_bytes so every
+    # write near the limit does not rescan. Returns (bytes used,
+    # expired, evicted).
+    now = time.time()
+
+    for mtime, _, path in entries(directory, [TMP_SUFFIX]):
+        if now - mtime > STALE_TMP_SECONDS:
+            remove(path)
+
+    found = sorted(entries(directory, suffixes))
+
+    cutoff = now - ttl if ttl is not None else float("-inf")
+
+    used = sum(size for _, size, _ in found)
+
+    target = max_bytes * 0.9
+
+    expired = 0
+    evicted = 0
+
+    for mtime, size, path in found:
+
+        if mtime >= cutoff and used <= target:
+            break
+
+        if not remove(path):
+            continue
+
+        used -= size
+
+        if mtime < cutoff:
+            expired += 1
+        else:
+            evicted += 1
+
+    return used, expired, evicted
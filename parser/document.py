@@ -0,0 +1,223 @@
+import contextvars
+import os
+import re
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from parser.cpus import worker_cpus
+from parser.extract import DISEASES, extract_scores
+from parser.metrics import timed
+from parser.render import (
+    SCORE_PAGE_MARKERS,
+    poppler_available,
+    resolve_score_page,
+    use_rasterizer
+)
+
+# Result layout of parse_document; part of the cache version
+DOCUMENT_VERSION = "v3_unnamed_patients"
+
+# Score pages parsed concurrently per process; rendering runs in
+# pdftoppm and OpenCV releases the GIL, so threads scale with this
+# worker's CPU share. In-process PyMuPDF renders one page at a time, so
+# pooled pages render with poppler when it is installed: each page pays
+# a pdftoppm start-up, but the pages render in parallel. Without poppler
+# the configured backend is kept and its renders take turns.
+PAGE_WORKERS = int(os.environ.get("PAGE_WORKERS", worker_cpus()))
+
+# Name printed on the cover page of each patient's report
+PATIENT_PATTERN = re.compile(
+    r"(?:first/last name|patient)\s*:\s*(.+?)(?:\s+address\s*:|\s{2,}|$)",
+    re.IGNORECASE | re.MULTILINE
+)
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+# ------------------------------------------------
+# PAGE POOL
+# ------------------------------------------------
+def get_pool():
+
+    global _pool, _pool_pid
+
+    with _pool_lock:
+
+        # threads do not survive fork; each worker process builds its own
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPoolExecutor(
+                max_workers=PAGE_WORKERS,
+                thread_name_prefix="page"
+            )
+            _pool_pid = os.getpid()
+
+        return _pool
+
+
+# ------------------------------------------------
+# LOCATE SCORE PAGES
+# ------------------------------------------------
+def page_texts(pdf_bytes):
+
+    # poppler's text extraction is far cheaper than a pdfminer layout
+    # pass over every page; pages come back separated by form feeds
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as f:
+
+        f.write(pdf_bytes)
+        f.flush()
+
+        out = subprocess.run(
+            ["pdftotext", "-enc", "UTF-8", f.name, "-"],
+            check=True,
+            capture_output=True
+        )
+
+    texts = out.stdout.decode("utf-8", "replace").split("\f")
+
+    # trailing form feed after the last page
+    if texts and not texts[-1].strip():
+        texts.pop()
+
+    return texts
+
+
+def score_pages(pdf_bytes):
+
+    # [(page index, patient)] for every score page, each page belonging
+    # to the patient named most recently before it
+    try:
+        texts = page_texts(pdf_bytes)
+    except (OSError, subprocess.CalledProcessError):
+        texts = []
+
+    pages = []
+    patient = None
+
+    for i, text in enumerate(texts):
+
+        match = PATIENT_PATTERN.search(text)
+
+        if match:
+            patient = match.group(1).strip()
+
+        lower = text.lower()
+
+        if any(marker in lower for marker in SCORE_PAGE_MARKERS):
+            pages.append((i, patient))
+
+    # scanned exports have no text layer: the configured score page
+    if not pages:
+        pages.append((resolve_score_page(pdf_bytes), patient))
+
+    return pages
+
+
+# ------------------------------------------------
+# MERGE PER PATIENT
+# ------------------------------------------------
+def merge_pages(pages, results):
+
+    groups = []
+
+    # patient -> the group their next page joins
+    current = {}
+
+    for (index, patient), result in zip(pages, results):
+
+        # every page labels its rows from DISEASES[0]; a page that fits
+        # after the rows found so far continues the same table
+        risks = list(result["scores"].values())
+
+        group = current.get(patient)
+
+        # without a name, a table that does not fit is the next
+        # patient's, not a copy of this one
+        if group is None or (
+            patient is None and group["rows"] + len(risks) > len(DISEASES)
+        ):
+            group = current[patient] = {
+                "patient": patient,
+                "pages": [],
+                "engines": [],
+                "rows": 0,
+                "scores": {}
+            }
+            groups.append(group)
+
+        group["pages"].append(index)
+
+        if result["engine"] not in group["engines"]:
+            group["engines"].append(result["engine"])
+
+        offset = group["rows"]
+
+        if offset + len(risks) <= len(DISEASES):
+
+            for disease, risk in zip(DISEASES[offset:], risks):
+                group["scores"][disease] = risk
+
+            group["rows"] += len(risks)
+            continue
+
+        # otherwise it is another copy of the table: it fills in bars the
+        # earlier pages did not show
+        for disease, risk in result["scores"].items():
+            if group["scores"].get(disease) is None:
+                group["scores"][disease] = risk
+
+    for group in groups:
+
+        engines = group.pop("engines")
+        group.pop("rows")
+
+        group["engine"] = "+".join(engines)
+
+    return groups
+
+
+# ------------------------------------------------
+# MAIN PARSER
+# ------------------------------------------------
+def parse_document(pdf_bytes, dpi=None):
+
+    with timed("score_pages"):
+        pages = score_pages(pdf_bytes)
+
+    if len(pages) == 1 or PAGE_WORKERS == 1:
+        # nothing to overlap: pages render serially with the configured
+        # backend
+        results = [extract_scores(pdf_bytes, dpi=dpi, page=index) for index, _ in pages]
+    else:
+        pool = get_pool()
+
+        # copy the context so stage timings and the rasterizer still
+        # reach the page threads
+        with use_rasterizer("poppler" if poppler_available() else None):
+            futures = [
+                pool.submit(
+                    contextvars.copy_context().run,
+                    extract_scores, pdf_bytes, dpi=dpi, page=index
+                )
+                for index, _ in pages
+            ]
+
+        results = [f.result() for f in futures]
+
+    patients = merge_pages(pages, results)
+
+    first = patients[0]
+
+    result = {
+        "engine": first["engine"],
+        "scores": first["scores"]
+    }
+
+    # combined exports and multi-page tables report every patient
+    if len(pages) > 1:
+        result["patients"] = patients
+
+    return result
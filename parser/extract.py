@@ -1,15 +1,88 @@
+import os
+import sqlite3
+
 import cv2
 import numpy as np
-from pdf2image import convert_from_bytes
 
-ENGINE_NAME = "v73_blue_intensity_classifier_fixed"
+from parser.layout_registry import (
+    layout_key,
+    lookup_layout,
+    register_layout,
+    trusted_variants
+)
+from parser.metrics import timed
+from parser.page_buffer import crop, to_bgr, to_hsv
+from parser.render import points_to_pixels, render_score_clip, render_score_page
 
-# Exact bar column location at dpi=200
-X_LEFT = 937
+ENGINE_NAME = "v73_blue_intensity_classifier_fixed"
 
-# Vertical scan range for disease bars
-MIN_Y = 880
-MAX_Y = 2050
+# Geometry is defined in PDF points so it holds at any render dpi. The
+# pixel constants are the same geometry on the dpi=200 grid the
+# thresholds were tuned on.
+REFERENCE_DPI = 200
+
+# Bar column x and width, and the vertical scan range for disease bars
+BAR_X_PT = 337.32
+BAR_WIDTH_PT = 5.4
+MIN_Y_PT = 316.8
+MAX_Y_PT = 738.0
+
+# Bar column as a PDF clip (x, y, width, height) in points
+BAR_CLIP = (BAR_X_PT, MIN_Y_PT, BAR_WIDTH_PT, MAX_Y_PT - MIN_Y_PT)
+
+X_LEFT, MIN_Y, BAR_WIDTH, MAX_Y = points_to_pixels(
+    (BAR_X_PT, MIN_Y_PT, BAR_WIDTH_PT, MAX_Y_PT), REFERENCE_DPI
+)
+
+# "page" renders the whole score page, "strip" only the bar column
+RENDER_MODE = os.environ.get("RENDER_MODE", "strip")
+
+# Row segmentation limits (sizes in pixels at dpi=200, scaled with dpi)
+SAT_ON = 40
+SAT_OFF = 20
+ROW_MIN_HEIGHT = 10
+ROW_MAX_HEIGHT = 40
+ROW_MIN_SPACING = 18
+
+# Bar colour thresholds (HSV means of the bar centre)
+BACKGROUND_MAX_SAT = 20
+RED_MAX_VALUE = 120
+ORANGE_MAX_VALUE = 175
+
+RISK_LABELS = np.array([None, "red", "orange", "yellow"], dtype=object)
+
+# Reuse validated row geometry from the layout registry
+LAYOUT_FAST_PATH = os.environ.get("LAYOUT_FAST_PATH", "1") == "1"
+
+# Bar top edges in the layout key are rounded to this many pixels (at
+# dpi=200), so the same geometry always gives the same key
+LAYOUT_EDGE_STEP = 4
+
+# Detection pass dpi; lower is faster, rows whose colour lands near a
+# threshold are then re-sampled at REFINE_DPI
+STRIP_DPI = int(os.environ.get("STRIP_DPI", 200))
+REFINE_DPI = int(os.environ.get("REFINE_DPI", 200))
+
+# HSV distance from a threshold that makes a low-dpi sample ambiguous
+AMBIGUOUS_SAT = 4
+AMBIGUOUS_VALUE = 8
+
+# Debug overlay defaults: crop to the label and bar area instead of the
+# whole page, downscale factor, and encoding
+DEBUG_CROP = os.environ.get("DEBUG_CROP", "0") == "1"
+DEBUG_SCALE = float(os.environ.get("DEBUG_SCALE", 1.0))
+DEBUG_FORMAT = os.environ.get("DEBUG_FORMAT", "png")
+
+# Label column, bar column and track, as a PDF clip in points
+DEBUG_CLIP = (BAR_X_PT - 100, MIN_Y_PT - 10, 200, MAX_Y_PT - MIN_Y_PT + 20)
+
+# format -> (extension, imencode params, mimetype); OpenCV's default PNG
+# settings are already its fastest, explicit levels only slow it down
+DEBUG_ENCODINGS = {
+    "png": (".png", [], "image/png"),
+    "jpeg": (".jpg", [cv2.IMWRITE_JPEG_QUALITY, 85], "image/jpeg"),
+    "webp": (".webp", [cv2.IMWRITE_WEBP_QUALITY, 80], "image/webp")
+}
 
 DISEASES = [
 "large_artery_stiffness",
@@ -40,50 +113,222 @@ DISEASES = [
 ]
 
 
+# ------------------------------------------------
+# BAR COLUMN
+# ------------------------------------------------
+def column_geometry(dpi=REFERENCE_DPI):
+
+    # bar column as (x, width, min_y, max_y) pixels at dpi
+    x, y, w, h = points_to_pixels(BAR_CLIP, dpi)
+
+    return x, w, y, y + h
+
+
+def bar_column(img, dpi=REFERENCE_DPI):
+
+    x, w, min_y, max_y = column_geometry(dpi)
+
+    return crop(img, min_y, max_y, x, x+w)
+
+
+def render_bar_column(pdf_bytes, page=None, dpi=STRIP_DPI):
+
+    # native resolution; row limits scale with dpi instead of resizing
+    return render_score_clip(pdf_bytes, BAR_CLIP, page=page, dpi=dpi)
+
+
 # ------------------------------------------------
 # DETECT ROW POSITIONS
 # ------------------------------------------------
 def detect_rows(img):
 
-    column = img[MIN_Y:MAX_Y, X_LEFT:X_LEFT+15]
+    return detect_column_rows(bar_column(img))
+
+
+def detect_column_rows(column, y_offset=MIN_Y, scale=1.0):
+
+    runs = segment_rows(saturation_profile(column), scale=scale)
+
+    return [(int(a)+y_offset, int(b)+y_offset) for a, b in runs]
+
+
+def saturation_profile(column):
+
+    hsv = to_hsv(column)
+
+    return hsv[:,:,1].mean(axis=1)
+
+
+def segment_rows(profile, scale=1.0):
+
+    # scale = dpi / 200 for columns rendered at another resolution
+    n = len(profile)
+
+    # hysteresis: a bar starts above SAT_ON and ends below SAT_OFF
+    high = profile > SAT_ON
+    low = profile < SAT_OFF
+
+    last_event = np.maximum.accumulate(
+        np.where(high | low, np.arange(n), -1)
+    )
+
+    inside = (last_event >= 0) & high[np.maximum(last_event, 0)]
+
+    prev = np.concatenate(([False], inside[:-1]))
+
+    starts = np.flatnonzero(inside & ~prev)
+    ends = np.flatnonzero(~inside & prev)
+
+    # a bar still open at the bottom of the column is dropped
+    starts = starts[:len(ends)]
+
+    height = ends - starts
+
+    keep = (
+        (height > ROW_MIN_HEIGHT * scale) &
+        (height < ROW_MAX_HEIGHT * scale)
+    )
+
+    starts = starts[keep]
+    ends = ends[keep]
+
+    # merge: a row must start more than ROW_MIN_SPACING below the last
+    # accepted row; one searchsorted step per accepted row
+    min_spacing = ROW_MIN_SPACING * scale
+
+    kept = []
+    i = 0
+
+    while i < len(starts):
+
+        kept.append(i)
+
+        i = int(np.searchsorted(starts, starts[i] + min_spacing, side="right"))
+
+    return np.stack((starts[kept], ends[kept]), axis=1).reshape(-1, 2)
 
-    hsv = cv2.cvtColor(column, cv2.COLOR_BGR2HSV)
+
+# ------------------------------------------------
+# CACHED ROW GEOMETRY
+# ------------------------------------------------
+def column_anchors(dpi=REFERENCE_DPI):
+
+    x, w, min_y, max_y = column_geometry(dpi)
+
+    return {
+        "risk_bar_x": x,
+        "bar_width": w,
+        "min_y": min_y,
+        "max_y": max_y,
+        "dpi": dpi
+    }
+
+
+def bar_edges(column, scale=1.0):
+
+    # (bars, first top edge, last top edge) down the middle of the column:
+    # identifies this page's layout and scan offset for the registry, at
+    # the cost of converting two pixel lines instead of the whole column.
+    # Only the outer edges are rounded, so anti-aliasing on the 25 inner
+    # ones cannot split one geometry across keys.
+    mid = column.shape[1] // 2
+
+    on = saturation_profile(column[:, mid - 1:mid + 1]) > SAT_ON
+
+    starts = np.flatnonzero(on[1:] & ~on[:-1]) + 1
+
+    if len(starts) == 0:
+        return [0, 0, 0]
+
+    step = LAYOUT_EDGE_STEP * scale
+
+    return [len(starts), int(round(starts[0] / step)), int(round(starts[-1] / step))]
+
+
+def registry_rows(entry):
+
+    # stored as centres + heights; rebuild the detector's (y1, y2) pairs
+    if "heights" not in entry:
+        return None
 
     rows = []
 
-    inside = False
-    start = 0
+    for centre, height in zip(entry["rows"], entry["heights"]):
+        y1 = int(round(centre - height / 2))
+        rows.append((y1, y1 + height))
 
-    for y in range(hsv.shape[0]):
+    return rows
 
-        s = np.mean(hsv[y,:,1])
 
-        if s > 40 and not inside:
-            start = y
-            inside = True
+def verify_rows(column, rows, y_offset=MIN_Y):
 
-        if s < 20 and inside:
+    # cheap check that the page still has bars exactly where the cached
+    # geometry says: saturated centres, and the same boundary lines the
+    # detector would have found on both sides of each edge (line above
+    # the bar not yet "on", first line "on", last line not yet "off",
+    # end line "off")
+    r = np.asarray(rows, dtype=int).reshape(-1, 2) - y_offset
 
-            end = y
+    if len(r) == 0 or r.min() < 1 or r.max() >= len(column):
+        return False
 
-            if 10 < (end-start) < 40:
-                rows.append((start+MIN_Y,end+MIN_Y))
+    mid = r.sum(axis=1) // 2
 
-            inside = False
+    lines = np.concatenate((mid - 1, mid, r[:, 0] - 1, r[:, 0], r[:, 1] - 1, r[:, 1]))
 
-    # remove duplicates
-    filtered = []
+    sat = saturation_profile(column[lines]).reshape(6, -1)
 
-    for r in rows:
+    centre = sat[:2].mean(axis=0)
+
+    return bool(
+        np.all(centre >= SAT_OFF) &
+        np.all(sat[2] <= SAT_ON) &
+        np.all(sat[3] > SAT_ON) &
+        np.all(sat[4] >= SAT_OFF) &
+        np.all(sat[5] < SAT_OFF)
+    )
 
-        if not filtered:
-            filtered.append(r)
-            continue
 
-        if r[0] - filtered[-1][0] > 18:
-            filtered.append(r)
+def locate_rows(column, dpi=REFERENCE_DPI):
 
-    return filtered
+    y_offset = column_geometry(dpi)[2]
+    scale = dpi / REFERENCE_DPI
+
+    if not LAYOUT_FAST_PATH:
+        return detect_column_rows(column, y_offset=y_offset, scale=scale)
+
+    anchors = column_anchors(dpi)
+
+    key = layout_key(column, dict(anchors, bar_edges=bar_edges(column, scale)))
+
+    # the registry is only a shortcut: an unreadable or locked database
+    # means a full detection, never a failed parse
+    try:
+        entry = lookup_layout(key)
+    except sqlite3.Error:
+        entry = None
+
+    for variant in trusted_variants(entry):
+
+        rows = registry_rows(variant)
+
+        if rows is not None and verify_rows(column, rows, y_offset=y_offset):
+            return rows
+
+    rows = detect_column_rows(column, y_offset=y_offset, scale=scale)
+
+    # only complete tables become trusted geometry
+    if len(rows) == len(DISEASES):
+
+        centres = [(y1 + y2) / 2 for y1, y2 in rows]
+        heights = [y2 - y1 for y1, y2 in rows]
+
+        try:
+            register_layout(key, anchors, centres, heights=heights)
+        except (OSError, sqlite3.Error):
+            pass
+
+    return rows
 
 
 # ------------------------------------------------
@@ -91,17 +336,37 @@ def detect_rows(img):
 # ------------------------------------------------
 def sample_bar_color(img, y1, y2):
 
-    mid = int((y1+y2)/2)
+    return sample_column_color(bar_column(img), y1, y2)
+
+
+def sample_column_color(column, y1, y2):
+
+    return sample_column_colors(column, [(y1, y2)])[0]
+
+
+def sample_column_colors(column, rows, y_offset=MIN_Y, scale=1.0):
+
+    # column may carry leading batch axes, e.g. (reports, height, width, 3)
+    # for stacked strips sampled at the same rows
+    rows = np.asarray(rows, dtype=int).reshape(-1, 2)
+
+    # band around each row centre (4 lines at dpi=200), gathered before
+    # converting so only the sampled pixels go through one cvtColor call
+    mid = rows.sum(axis=1) // 2 - y_offset
+
+    half = max(1, int(round(2 * scale)))
 
-    sample = img[mid-2:mid+2, X_LEFT:X_LEFT+15]
+    band = column[..., mid[:, None] + np.arange(-half, half), :, :]
 
-    hsv = cv2.cvtColor(sample, cv2.COLOR_BGR2HSV)
+    shape = band.shape
 
-    h = np.mean(hsv[:,:,0])
-    s = np.mean(hsv[:,:,1])
-    v = np.mean(hsv[:,:,2])
+    if band.size == 0:
+        return np.zeros(shape[:-3] + (3,))
 
-    return np.array([h,s,v])
+    hsv = to_hsv(band.reshape(-1, shape[-2], 3)).reshape(shape)
+
+    # (..., rows, 4, width, 3) -> (..., rows, 3) mean H/S/V
+    return hsv.mean(axis=(-3, -2))
 
 
 # ------------------------------------------------
@@ -112,27 +377,110 @@ def classify_bar(sample):
     h, s, v = sample
 
     # ignore background
-    if s < 20:
+    if s < BACKGROUND_MAX_SAT:
         return None
 
     # dark blue = highest risk
-    if v < 120:
+    if v < RED_MAX_VALUE:
         return "red"
 
     # medium blue
-    if v < 175:
+    if v < ORANGE_MAX_VALUE:
         return "orange"
 
     # cyan/light blue baseline
     return "yellow"
 
 
+def classify_samples(samples):
+
+    # classify_bar over any (..., 3) array of H/S/V means at once
+    samples = np.asarray(samples)
+
+    s = samples[..., 1]
+    v = samples[..., 2]
+
+    code = np.select(
+        [s < BACKGROUND_MAX_SAT, v < RED_MAX_VALUE, v < ORANGE_MAX_VALUE],
+        [0, 1, 2],
+        default=3
+    )
+
+    return RISK_LABELS[code]
+
+
+def classify_rows(column, rows, y_offset=MIN_Y, scale=1.0):
+
+    samples = sample_column_colors(column, rows, y_offset=y_offset, scale=scale)
+
+    return classify_samples(samples), samples
+
+
+def ambiguous_samples(samples):
+
+    # samples within a few HSV steps of a threshold, where the blur of a
+    # low-dpi render could have moved them across it
+    samples = np.asarray(samples).reshape(-1, 3)
+
+    s = samples[:, 1]
+    v = samples[:, 2]
+
+    near_value = (
+        (np.abs(v - RED_MAX_VALUE) < AMBIGUOUS_VALUE) |
+        (np.abs(v - ORANGE_MAX_VALUE) < AMBIGUOUS_VALUE)
+    )
+
+    return (
+        (np.abs(s - BACKGROUND_MAX_SAT) < AMBIGUOUS_SAT) |
+        ((s >= BACKGROUND_MAX_SAT) & near_value)
+    )
+
+
+def refine_rows(pdf_bytes, rows, dpi, page=None, refine_dpi=REFINE_DPI):
+
+    # re-sample rows (pixels at dpi) from one high-dpi clip spanning them
+    rows = np.asarray(rows, dtype=float).reshape(-1, 2) * 72 / dpi
+
+    top = rows.min() - 1
+    bottom = rows.max() + 1
+
+    clip = (BAR_X_PT, top, BAR_WIDTH_PT, bottom - top)
+
+    strip = render_score_clip(pdf_bytes, clip, page=page, dpi=refine_dpi)
+
+    y_offset = points_to_pixels(clip, refine_dpi)[1]
+
+    fine = np.round(rows * refine_dpi / 72).astype(int)
+
+    labels, _ = classify_rows(
+        strip,
+        fine,
+        y_offset=y_offset,
+        scale=refine_dpi / REFERENCE_DPI
+    )
+
+    return labels
+
+
 # ------------------------------------------------
 # DEBUG DRAW
 # ------------------------------------------------
-def draw_debug(img, rows, scores):
+def draw_debug(img, rows, scores, dpi=REFERENCE_DPI, origin=(0, 0)):
+
+    # origin: page pixel position of img[0, 0] when img is a crop
+
+    # OpenCV draws and encodes BGR; the conversion doubles as the copy
+    debug = to_bgr(img)
+
+    if debug is img:
+        debug = img.copy()
+
+    debug = np.asarray(debug)
+
+    x, w, _, _ = column_geometry(dpi)
 
-    debug = img.copy()
+    ox, oy = origin
+    x -= ox
 
     colors = {
         "yellow":(0,255,255),
@@ -152,8 +500,8 @@ def draw_debug(img, rows, scores):
 
         cv2.rectangle(
             debug,
-            (X_LEFT,y1),
-            (X_LEFT+15,y2),
+            (x,y1-oy),
+            (x+w,y2-oy),
             colors[risk],
             3
         )
@@ -161,35 +509,118 @@ def draw_debug(img, rows, scores):
     return debug
 
 
+def render_debug_view(pdf_bytes, page=None, dpi=REFERENCE_DPI, cropped=False):
+
+    # (image, origin): the whole score page, or only DEBUG_CLIP
+    if not cropped:
+        return render_score_page(pdf_bytes, page=page, dpi=dpi), (0, 0)
+
+    img = render_score_clip(pdf_bytes, DEBUG_CLIP, page=page, dpi=dpi)
+
+    x, y, _, _ = points_to_pixels(DEBUG_CLIP, dpi)
+
+    return img, (x, y)
+
+
+def encode_overlay(overlay, scale=1.0, fmt="png"):
+
+    if scale < 1:
+        overlay = cv2.resize(
+            overlay,
+            None,
+            fx=scale,
+            fy=scale,
+            interpolation=cv2.INTER_AREA
+        )
+
+    ext, params, mimetype = DEBUG_ENCODINGS[fmt]
+
+    _, data = cv2.imencode(ext, overlay, params)
+
+    return data.tobytes(), mimetype
+
+
+def debug_options(cropped=None, scale=None, fmt=None):
+
+    options = {
+        "cropped": DEBUG_CROP if cropped is None else bool(cropped),
+        "scale": DEBUG_SCALE if scale is None else float(scale),
+        "fmt": DEBUG_FORMAT if fmt is None else fmt
+    }
+
+    if not 0 < options["scale"] <= 1:
+        raise ValueError("debug scale must be in (0, 1]")
+
+    if options["fmt"] not in DEBUG_ENCODINGS:
+        raise ValueError(f"debug format must be one of {', '.join(DEBUG_ENCODINGS)}")
+
+    return options
+
+
 # ------------------------------------------------
 # MAIN PARSER
 # ------------------------------------------------
-def parse_report(pdf_bytes, debug=False):
+def read_column(pdf_bytes, column, dpi, page=None):
 
-    images = convert_from_bytes(pdf_bytes, dpi=200)
+    # (rows, scores) for a bar column rendered at dpi, or None when a
+    # low-dpi pass could not find every bar
+    with timed("detect_rows"):
+        rows = locate_rows(column, dpi)
 
-    img = np.array(images[1])
+    if dpi < REFINE_DPI and len(rows) != len(DISEASES):
+        return None
 
-    rows = detect_rows(img)
+    with timed("classify_rows"):
+        labels, samples = classify_rows(
+            column,
+            rows[:len(DISEASES)],
+            y_offset=column_geometry(dpi)[2],
+            scale=dpi / REFERENCE_DPI
+        )
 
-    scores = {}
+    if dpi < REFINE_DPI:
 
-    for i,(y1,y2) in enumerate(rows):
+        unsure = np.flatnonzero(ambiguous_samples(samples))
 
-        if i >= len(DISEASES):
-            break
+        if len(unsure):
+            with timed("refine_rows"):
+                labels[unsure] = refine_rows(
+                    pdf_bytes,
+                    [rows[i] for i in unsure],
+                    dpi,
+                    page=page
+                )
+
+    return rows, dict(zip(DISEASES, labels))
 
-        sample = sample_bar_color(img,y1,y2)
 
-        scores[DISEASES[i]] = classify_bar(sample)
+def parse_report(pdf_bytes, debug=False, page=None, mode=None, dpi=None):
 
     if debug:
+        _, overlay, _ = parse_report_with_overlay(pdf_bytes, page=page, dpi=dpi)
+        return overlay
 
-        overlay = draw_debug(img,rows,scores)
+    if mode is None:
+        mode = RENDER_MODE
 
-        _,png = cv2.imencode(".png",overlay)
+    if dpi is None:
+        dpi = STRIP_DPI
 
-        return png.tobytes()
+    if mode == "page":
+        with timed("render_page"):
+            img = render_score_page(pdf_bytes, page=page, dpi=dpi)
+        column = bar_column(img, dpi)
+    else:
+        with timed("render_strip"):
+            column = render_bar_column(pdf_bytes, page=page, dpi=dpi)
+
+    found = read_column(pdf_bytes, column, dpi, page=page)
+
+    # too coarse to find every bar: pay for the full-resolution pass
+    if found is None:
+        return parse_report(pdf_bytes, page=page, mode=mode, dpi=REFINE_DPI)
+
+    _, scores = found
 
     return {
         "engine":ENGINE_NAME,
@@ -197,6 +628,57 @@ def parse_report(pdf_bytes, debug=False):
     }
 
 
-def extract_scores(pdf_bytes):
+def parse_report_with_overlay(pdf_bytes, page=None, dpi=None, cropped=None,
+                              scale=None, fmt=None):
+
+    # scores and debug overlay from a single render:
+    # (result, overlay bytes, mimetype)
+    options = debug_options(cropped, scale, fmt)
+
+    if dpi is None:
+        dpi = STRIP_DPI
+
+    with timed("render_page"):
+        img, (ox, oy) = render_debug_view(pdf_bytes, page, dpi, options["cropped"])
+
+    x, w, min_y, max_y = column_geometry(dpi)
+
+    column = crop(img, min_y - oy, max_y - oy, x - ox, x + w - ox)
+
+    found = read_column(pdf_bytes, column, dpi, page=page)
+
+    if found is None:
+        return parse_report_with_overlay(
+            pdf_bytes, page=page, dpi=REFINE_DPI, **options
+        )
+
+    rows, scores = found
+
+    with timed("draw_debug"):
+        overlay = draw_debug(img, rows, scores, dpi, origin=(ox, oy))
+
+    with timed("encode_debug"):
+        data, mimetype = encode_overlay(overlay, options["scale"], options["fmt"])
+
+    result = {
+        "engine":ENGINE_NAME,
+        "scores":scores
+    }
+
+    return result, data, mimetype
+
+
+def extract_scores(pdf_bytes, debug=False, dpi=None, page=None):
+
+    # vector bars need no rendering; scanned pages fall back to raster
+    if not debug:
+
+        from parser.vector_extract import parse_vector_report
+
+        with timed("vector_extract"):
+            result = parse_vector_report(pdf_bytes, page=page)
+
+        if result is not None:
+            return result
 
-    return parse_report(pdf_bytes)
+    return parse_report(pdf_bytes, debug=debug, page=page, dpi=dpi)
@@ -0,0 +1,378 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from parser.batch import parse_one
+from parser.cache import result_cache
+from parser.metrics import timed
+
+JOB_DB = os.environ.get("JOB_DB", "/tmp/ithrive-jobs.sqlite3")
+
+# Worker threads per process
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+
+# A running job owned by another host (or an unreadable owner) and not
+# finished after this long is assumed orphaned and is queued again;
+# owners on this host are checked directly
+JOB_STALE_SECONDS = int(os.environ.get("JOB_STALE_SECONDS", 600))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+
+# Finished jobs are deleted after this long
+JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS", 86400))
+
+# Idle workers re-check the table this often (jobs may arrive via
+# another process)
+JOB_POLL_SECONDS = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    filename TEXT,
+    pdf BLOB,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created);
+"""
+
+_workers_pid = None
+_workers_lock = threading.Lock()
+_wake = threading.Event()
+
+
+# ------------------------------------------------
+# DATABASE
+# ------------------------------------------------
+def connect():
+
+    # one short-lived connection per call; sqlite3 connections must not
+    # cross threads
+    conn = sqlite3.connect(JOB_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+
+    return conn
+
+
+def init_db():
+
+    conn = connect()
+
+    try:
+        # WAL lets pollers read while a worker writes
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+    finally:
+        conn.close()
+
+
+def job_owner():
+
+    return f"{os.uname().nodename}:{os.getpid()}:{threading.get_ident()}"
+
+
+# ------------------------------------------------
+# JOB API
+# ------------------------------------------------
+def submit_job(pdf_bytes, filename=None):
+
+    job_id = uuid.uuid4().hex
+    now = time.time()
+
+    cached = result_cache.get(result_cache.key(pdf_bytes, "scores"))
+
+    conn = connect()
+
+    try:
+        if cached is not None:
+            conn.execute(
+                "INSERT INTO jobs (id, status, filename, result, created, finished) "
+                "VALUES (?, 'done', ?, ?, ?, ?)",
+                (job_id, filename, json.dumps(cached), now, now)
+            )
+        else:
+            conn.execute(
+                "INSERT INTO jobs (id, status, filename, pdf, created) "
+                "VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, filename, pdf_bytes, now)
+            )
+    finally:
+        conn.close()
+
+    _wake.set()
+
+    return job_id
+
+
+def get_job(job_id):
+
+    conn = connect()
+
+    try:
+        row = conn.execute(
+            "SELECT id, status, filename, result, error, attempts, "
+            "created, started, finished FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+
+    if row is None:
+        return None
+
+    job = {
+        "job_id": row["id"],
+        "status": row["status"],
+        "filename": row["filename"],
+        "attempts": row["attempts"],
+        "created": row["created"],
+        "started": row["started"],
+        "finished": row["finished"]
+    }
+
+    if row["result"] is not None:
+        job["result"] = json.loads(row["result"])
+
+    if row["error"] is not None:
+        job["error"] = json.loads(row["error"])
+
+    return job
+
+
+def queue_depth():
+
+    conn = connect()
+
+    try:
+        rows = conn.execute(
+            "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+        ).fetchall()
+    finally:
+        conn.close()
+
+    depth = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+
+    for status, count in rows:
+        depth[status] = count
+
+    return depth
+
+
+# ------------------------------------------------
+# WORKER SIDE
+# ------------------------------------------------
+def claim_job():
+
+    conn = connect()
+
+    try:
+        # IMMEDIATE takes the write lock up front, so two workers (in any
+        # process) can never claim the same row
+        conn.execute("BEGIN IMMEDIATE")
+
+        row = conn.execute(
+            "SELECT id, pdf FROM jobs WHERE status = 'queued' "
+            "ORDER BY created LIMIT 1"
+        ).fetchone()
+
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+
+        conn.execute(
+            "UPDATE jobs SET status = 'running', started = ?, owner = ?, "
+            "attempts = attempts + 1 WHERE id = ?",
+            (time.time(), job_owner(), row["id"])
+        )
+
+        conn.execute("COMMIT")
+
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    finally:
+        conn.close()
+
+    return row["id"], row["pdf"]
+
+
+def finish_job(job_id, outcome):
+
+    conn = connect()
+
+    try:
+        if "result" in outcome:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, pdf = NULL, "
+                "finished = ? WHERE id = ?",
+                (json.dumps(outcome["result"]), time.time(), job_id)
+            )
+        else:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, pdf = NULL, "
+                "finished = ? WHERE id = ?",
+                (json.dumps(outcome), time.time(), job_id)
+            )
+    finally:
+        conn.close()
+
+
+def process_alive(pid):
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    return True
+
+
+def local_owners(conn):
+
+    # (orphaned, live) ids of running jobs claimed by a process on this
+    # host. Orphans (restarted or recycled worker) are queued again at
+    # once; live ones are still being parsed however long they take.
+    # Owners on other hosts, or unparseable ones, are left to the
+    # JOB_STALE_SECONDS rule.
+    host = os.uname().nodename
+
+    orphaned = []
+    live = []
+
+    rows = conn.execute(
+        "SELECT id, owner FROM jobs WHERE status = 'running'"
+    ).fetchall()
+
+    for row in rows:
+
+        parts = (row["owner"] or "").split(":")
+
+        if len(parts) != 3 or parts[0] != host or not parts[1].isdigit():
+            continue
+
+        if process_alive(int(parts[1])):
+            live.append(row["id"])
+        else:
+            orphaned.append(row["id"])
+
+    return orphaned, live
+
+
+def recover_jobs():
+
+    now = time.time()
+
+    conn = connect()
+
+    try:
+        orphaned, live = local_owners(conn)
+
+        for job_id in orphaned:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL "
+                "WHERE id = ? AND status = 'running' AND attempts < ?",
+                (job_id, JOB_MAX_ATTEMPTS)
+            )
+
+        not_live = f"id NOT IN ({', '.join('?' * len(live))})"
+
+        conn.execute(
+            "UPDATE jobs SET status = 'queued', owner = NULL "
+            f"WHERE status = 'running' AND started < ? AND attempts < ? AND {not_live}",
+            (now - JOB_STALE_SECONDS, JOB_MAX_ATTEMPTS, *live)
+        )
+
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', pdf = NULL, finished = ?, "
+            f"error = ? WHERE status = 'running' AND started < ? AND {not_live}",
+            (
+                now,
+                json.dumps({"error": "worker_failure",
+                            "message": "job abandoned too many times"}),
+                now - JOB_STALE_SECONDS,
+                *live
+            )
+        )
+
+        conn.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') "
+            "AND finished < ?",
+            (now - JOB_RETENTION_SECONDS,)
+        )
+    finally:
+        conn.close()
+
+
+def run_job(job_id, pdf_bytes):
+
+    with timed("job"):
+        outcome = parse_one(pdf_bytes)
+
+    if "result" in outcome:
+        result_cache.put(result_cache.key(pdf_bytes, "scores"), outcome["result"])
+
+    finish_job(job_id, outcome)
+
+
+def worker_loop():
+
+    last_recover = 0
+
+    while True:
+
+        try:
+            if time.time() - last_recover > JOB_POLL_SECONDS * 30:
+                recover_jobs()
+                last_recover = time.time()
+
+            claimed = claim_job()
+
+        except sqlite3.Error:
+            claimed = None
+
+        if claimed is None:
+            _wake.wait(JOB_POLL_SECONDS)
+            _wake.clear()
+            continue
+
+        try:
+            run_job(*claimed)
+        except sqlite3.Error:
+            # left as running; recover_jobs requeues it later
+            pass
+
+
+def ensure_workers():
+
+    global _workers_pid
+
+    # threads do not survive fork, so each process starts its own
+    if _workers_pid == os.getpid():
+        return
+
+    with _workers_lock:
+
+        if _workers_pid == os.getpid():
+            return
+
+        init_db()
+
+        for i in range(JOB_WORKERS):
+            threading.Thread(
+                target=worker_loop,
+                name=f"job-worker-{i}",
+                daemon=True
+            ).start()
+
+        _workers_pid = os.getpid()
@@ -1,9 +1,33 @@
 import json
 import hashlib
 import os
+import sqlite3
+import threading
+import time
 
+# Seed / export file; the live registry is the SQLite database below
 REGISTRY_FILE = "parser/layout_registry.json"
 
+# Shared by all workers on the host
+REGISTRY_DB = os.environ.get("LAYOUT_REGISTRY_DB", "/tmp/ithrive-layouts.sqlite3")
+
+# How often a process checks whether another process changed the registry
+REGISTRY_REFRESH_SECONDS = 0.5
+
+# Row centres closer than this (px at dpi=200) are the same row
+ROW_MERGE_DISTANCE = 18
+
+# Matching sightings needed before a layout's geometry is trusted
+LAYOUT_MIN_VALIDATIONS = 2
+
+# Max centre drift (px) for two sightings to count as the same geometry
+ROW_MATCH_TOLERANCE = 2
+
+# Distinct row geometries kept per layout key. Keys round the page's bar
+# edges, so nearby scan offsets and colour-dependent edge detection can
+# share a key with slightly different rows.
+LAYOUT_MAX_VARIANTS = 4
+
 
 def fingerprint_layout(image, anchors, rows):
 
@@ -19,36 +43,328 @@ def fingerprint_layout(image, anchors, rows):
     return hashlib.sha1(raw).hexdigest()
 
 
-def load_registry():
-    if not os.path.exists(REGISTRY_FILE):
-        return {}
+def layout_key(image, anchors):
+
+    # like fingerprint_layout, but computable before rows are detected;
+    # anchors must include something read from the page itself (e.g. bar
+    # edges), or every page of one size shares a key
+    data = {
+        "width": image.shape[1],
+        "height": image.shape[0],
+        "anchors": anchors
+    }
+
+    raw = json.dumps(data, sort_keys=True).encode()
+
+    return hashlib.sha1(raw).hexdigest()
+
+
+def clean_rows(rows, merge_distance=ROW_MERGE_DISTANCE):
+
+    # collapse near-duplicate row positions to their mean, repeating until
+    # every pair of neighbouring rows is further apart than merge_distance
+    clusters = [[float(y), 1] for y in sorted(rows)]
+
+    merged = True
+
+    while merged:
+
+        merged = False
+        out = []
+
+        for y, n in clusters:
+
+            if out and y - out[-1][0] <= merge_distance:
+                prev_y, prev_n = out[-1]
+                out[-1] = [(prev_y * prev_n + y * n) / (prev_n + n), prev_n + n]
+                merged = True
+            else:
+                out.append([y, n])
+
+        clusters = out
+
+    return [round(y, 1) for y, _ in clusters]
+
+
+# ------------------------------------------------
+# SQLITE BACKEND
+# ------------------------------------------------
+class LayoutRegistry:
+
+    def __init__(self, path=REGISTRY_DB, seed_file=REGISTRY_FILE):
+
+        self.path = path
+        self.seed_file = seed_file
+
+        self.lock = threading.Lock()
+
+        self.conn = None
+        self.pid = None
+
+        # fingerprint -> entry, loaded once per process
+        self.index = {}
+        self.data_version = None
+        self.checked = 0.0
+
+    def connection(self):
+
+        # connections do not survive fork; reopen in each worker
+        if self.conn is None or self.pid != os.getpid():
+
+            self.conn = sqlite3.connect(
+                self.path,
+                timeout=30,
+                isolation_level=None,
+                check_same_thread=False
+            )
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS layouts ("
+                "hash TEXT PRIMARY KEY, entry TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+            self.pid = os.getpid()
+            self.data_version = None
+
+            self.seed()
+
+        return self.conn
+
+    def seed(self):
+
+        # first use of a fresh database: import the JSON registry
+        if self.conn.execute("SELECT COUNT(*) FROM layouts").fetchone()[0]:
+            return
+
+        try:
+            with open(self.seed_file) as f:
+                seed = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        now = time.time()
+
+        self.conn.execute("BEGIN IMMEDIATE")
+
+        try:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO layouts (hash, entry, updated) VALUES (?, ?, ?)",
+                [(h, json.dumps(e, default=int), now) for h, e in seed.items()]
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            # SQLite may already have rolled back (e.g. on I/O errors);
+            # a second ROLLBACK would hide the real error
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+            raise
+
+    def refresh(self, force=False):
+
+        # data_version changes whenever another connection commits, so
+        # other workers' writes show up here without re-reading every time
+        now = time.monotonic()
+
+        if not force and now - self.checked < REGISTRY_REFRESH_SECONDS and self.pid == os.getpid():
+            return
+
+        conn = self.connection()
+
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+
+        self.checked = now
+
+        if version == self.data_version and not force:
+            return
+
+        rows = conn.execute("SELECT hash, entry FROM layouts").fetchall()
+
+        self.index = {h: json.loads(e) for h, e in rows}
+        self.data_version = version
+
+    def get(self, layout_hash):
+
+        with self.lock:
+            self.refresh()
+            return self.index.get(layout_hash)
+
+    def all(self):
+
+        with self.lock:
+            self.refresh()
+            return dict(self.index)
 
-    try:
-        with open(REGISTRY_FILE, "r") as f:
-            return json.load(f)
-    except:
-        return {}
+    def update(self, layout_hash, change):
 
-    with open(REGISTRY_FILE, "r") as f:
-        return json.load(f)
+        # read-modify-write of one entry under the database write lock;
+        # change(old_entry_or_None) returns the new entry, or None to skip
+        with self.lock:
+
+            conn = self.connection()
+
+            conn.execute("BEGIN IMMEDIATE")
+
+            try:
+                row = conn.execute(
+                    "SELECT entry FROM layouts WHERE hash = ?", (layout_hash,)
+                ).fetchone()
+
+                old = json.loads(row[0]) if row else None
+
+                entry = change(old)
+
+                if entry is not None:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO layouts (hash, entry, updated) "
+                        "VALUES (?, ?, ?)",
+                        (layout_hash, json.dumps(entry, default=int), time.time())
+                    )
+
+                conn.execute("COMMIT")
+
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+
+            result = entry if entry is not None else old
+
+            if result is not None:
+                self.index[layout_hash] = result
+
+            return result
+
+    def replace_all(self, registry):
+
+        with self.lock:
+
+            conn = self.connection()
+
+            now = time.time()
+
+            conn.execute("BEGIN IMMEDIATE")
+
+            try:
+                conn.execute("DELETE FROM layouts")
+                conn.executemany(
+                    "INSERT INTO layouts (hash, entry, updated) VALUES (?, ?, ?)",
+                    [(h, json.dumps(e, default=int), now) for h, e in registry.items()]
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+
+            self.index = dict(registry)
+
+
+layout_registry = LayoutRegistry()
+
+
+# ------------------------------------------------
+# REGISTRY API
+# ------------------------------------------------
+def load_registry():
+
+    return layout_registry.all()
 
 
 def save_registry(registry):
-    with open(REGISTRY_FILE, "w") as f:
-        json.dump(registry, f, indent=2, default=int)
 
+    layout_registry.replace_all(registry)
+
+
+def export_registry(path=REGISTRY_FILE):
+
+    # snapshot the live registry as JSON (the seed format), atomically
+    tmp = f"{path}.{os.getpid()}.tmp"
+
+    with open(tmp, "w") as f:
+        json.dump(load_registry(), f, indent=2, default=int)
+
+    os.replace(tmp, path)
 
-def register_layout(layout_hash, anchors, rows):
 
-    registry = load_registry()
+def lookup_layout(layout_hash):
 
-    if layout_hash not in registry:
+    return layout_registry.get(layout_hash)
 
-        registry[layout_hash] = {
+
+def same_geometry(entry, rows):
+
+    old = entry.get("rows", [])
+
+    if len(old) != len(rows):
+        return False
+
+    return all(abs(a - b) <= ROW_MATCH_TOLERANCE for a, b in zip(old, rows))
+
+
+def layout_variants(entry):
+
+    # row geometries seen under one key; JSON-era entries hold a single
+    # one at the top level
+    if entry is None:
+        return []
+
+    return entry.get("variants", [entry])
+
+
+def trusted_variants(entry):
+
+    return [
+        v for v in layout_variants(entry)
+        if v.get("validations", 0) >= LAYOUT_MIN_VALIDATIONS
+    ]
+
+
+def register_layout(layout_hash, anchors, rows, heights=None):
+
+    rows = clean_rows(rows)
+
+    # a sighting only ever validates or adds a variant, never replaces
+    # one, and a key with LAYOUT_MAX_VARIANTS geometries takes no more:
+    # pages that match nothing are detected in full without a write
+    def settled(entry):
+
+        variants = layout_variants(entry)
+
+        for v in variants:
+            if same_geometry(v, rows):
+                return v.get("validations", 0) >= LAYOUT_MIN_VALIDATIONS
+
+        return len(variants) >= LAYOUT_MAX_VARIANTS
+
+    entry = layout_registry.get(layout_hash)
+
+    if entry is not None and settled(entry):
+        return entry
+
+    def change(entry):
+
+        if entry is not None and settled(entry):
+            return None
+
+        variants = [dict(v) for v in layout_variants(entry)]
+
+        for v in variants:
+            if same_geometry(v, rows):
+                v["validations"] = v.get("validations", 0) + 1
+                break
+        else:
+            variant = {
+                "rows": rows,
+                "validations": 1
+            }
+
+            if heights is not None:
+                variant["heights"] = list(heights)
+
+            variants.append(variant)
+
+        return {
             "anchors": anchors,
-            "rows": rows
+            "variants": variants
         }
 
-        save_registry(registry)
-
-    return registry[layout_hash]
\ No newline at end of file
+    return layout_registry.update(layout_hash, change)
@@ -1,5 +1,19 @@
+import json
+
 import numpy as np
 
+CATALOG_FILE = "parser/layout_catalog.json"
+
+# Per-feature difference that still counts as agreeing with a template
+FEATURE_TOLERANCE = 0.05
+
+# Features that must agree for a template to match
+MIN_MATCHED_FEATURES = 3
+
+UNKNOWN_LAYOUT = "unknown_layout"
+
+_catalog = None
+
 
 def compute_layout_fingerprint(img, anchors):
 
@@ -16,34 +30,82 @@ def compute_layout_fingerprint(img, anchors):
     return fingerprint
 
 
-def identify_layout(fingerprint):
+# ------------------------------------------------
+# TEMPLATE CATALOG
+# ------------------------------------------------
+def load_catalog(path=CATALOG_FILE):
+
+    # (feature names, layout names, templates x features matrix)
+    global _catalog
+
+    with open(path) as f:
+        data = json.load(f)
+
+    features = list(data["features"])
+    names = list(data["layouts"])
+
+    matrix = np.array(
+        [data["layouts"][name] for name in names],
+        dtype=np.float64
+    ).reshape(len(names), len(features))
+
+    _catalog = features, names, matrix
+
+    return _catalog
 
-    known_layouts = {
-        "bio_scan_v1": {
-            "aspect_ratio": 0.773,
-            "header_pos": 0.026,
-            "left_col": 0.075,
-            "risk_bar_col": 0.153
+
+def get_catalog():
+
+    if _catalog is None:
+        load_catalog()
+
+    return _catalog
+
+
+# ------------------------------------------------
+# MATCHING
+# ------------------------------------------------
+def match_layout(fingerprint):
+
+    features, names, matrix = get_catalog()
+
+    if not names:
+        return {
+            "layout": UNKNOWN_LAYOUT,
+            "distance": None,
+            "runner_up": None,
+            "runner_up_distance": None
         }
-    }
 
-    for layout_name, ref in known_layouts.items():
+    vector = np.array([fingerprint[f] for f in features], dtype=np.float64)
+
+    # differences in units of the tolerance against every template at once
+    diff = np.abs(matrix - vector) / FEATURE_TOLERANCE
+
+    distances = np.sqrt((diff ** 2).mean(axis=1))
+    matched = (diff < 1).sum(axis=1)
 
-        score = 0
+    # only templates with enough agreeing features can match, as in the
+    # first-match loop this replaces; distance ranks those, then the rest
+    eligible = matched >= min(MIN_MATCHED_FEATURES, len(features))
 
-        if abs(fingerprint["aspect_ratio"] - ref["aspect_ratio"]) < 0.05:
-            score += 1
+    order = np.lexsort((distances, ~eligible))
 
-        if abs(fingerprint["header_pos"] - ref["header_pos"]) < 0.05:
-            score += 1
+    best = order[0]
+    runner_up = order[1] if len(order) > 1 else None
 
-        if abs(fingerprint["left_col"] - ref["left_col"]) < 0.05:
-            score += 1
+    layout = names[best] if eligible[best] else UNKNOWN_LAYOUT
+
+    return {
+        "layout": layout,
+        "distance": round(float(distances[best]), 4),
+        "runner_up": names[runner_up] if runner_up is not None else None,
+        "runner_up_distance": (
+            round(float(distances[runner_up]), 4) if runner_up is not None else None
+        )
+    }
 
-        if abs(fingerprint["risk_bar_col"] - ref["risk_bar_col"]) < 0.05:
-            score += 1
 
-        if score >= 3:
-            return layout_name
+def identify_layout(fingerprint):
 
-    return "unknown_layout"
\ No newline at end of file
+    return match_layout(fingerprint)["layout"]
@@ -0,0 +1,486 @@
+import atexit
+import bisect
+import contextvars
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+STAGE_METRIC = "ithrive_stage_seconds"
+
+# Every process of the server (web workers, batch pool) writes a
+# snapshot here so /metrics can add them up whichever worker answers.
+# Empty keeps metrics per process, so scripts and benchmarks that time
+# stages never add to a running service's totals; the server turns it
+# on with enable_directory().
+METRICS_DIR = os.environ.get("METRICS_DIR", "")
+
+# Used by enable_directory() when METRICS_DIR is not set
+DEFAULT_METRICS_DIR = "/tmp/ithrive-metrics"
+
+# How often a process rewrites its snapshot after a change
+METRICS_FLUSH_SECONDS = 1.0
+
+# Totals of exited processes, so counters never go backwards
+ARCHIVE_FILE = "archive.json"
+LOCK_FILE = "fold.lock"
+
+_lock = threading.Lock()
+_histograms = {}
+_gauges = {}
+
+# Per-request stage timings (ms), set by request_timings()
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+_flusher_pid = None
+_snapshot_name = None
+_last_snapshot = None
+_exit_flush = False
+
+
+# ------------------------------------------------
+# HISTOGRAMS
+# ------------------------------------------------
+def observe(stage, seconds):
+
+    ensure_flusher()
+
+    with _lock:
+
+        hist = _histograms.get(stage)
+
+        if hist is None:
+            hist = _histograms[stage] = {
+                "buckets": [0] * len(BUCKETS),
+                "count": 0,
+                "sum": 0.0
+            }
+
+        # counts per bucket; made cumulative when rendered
+        i = bisect.bisect_left(BUCKETS, seconds)
+
+        if i < len(BUCKETS):
+            hist["buckets"][i] += 1
+
+        hist["count"] += 1
+        hist["sum"] += seconds
+
+
+@contextmanager
+def timed(stage):
+
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+
+        elapsed = time.perf_counter() - start
+
+        observe(stage, elapsed)
+
+        timings = _request_timings.get()
+
+        if timings is not None:
+            timings[stage] = round(timings.get(stage, 0.0) + elapsed * 1000, 3)
+
+
+@contextmanager
+def request_timings():
+
+    timings = {}
+
+    token = _request_timings.set(timings)
+
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+# ------------------------------------------------
+# GAUGES
+# ------------------------------------------------
+def register_gauges(prefix, collect, counters=(), shared=()):
+
+    # collect() returns {name: number}. Names in counters only ever grow
+    # and are summed over every process that ever ran; names in shared
+    # describe host-wide state and are read from the answering process;
+    # the rest are per-process levels summed over live processes.
+    with _lock:
+        _gauges[prefix] = (collect, frozenset(counters), frozenset(shared))
+
+
+def collect_gauges(include_shared):
+
+    # ({metric: value} counters, {metric: value} gauges, {metric: value} shared)
+    with _lock:
+        sources = dict(_gauges)
+
+    counters = {}
+    gauges = {}
+    shared_values = {}
+
+    for prefix in sorted(sources):
+
+        collect, counter_names, shared = sources[prefix]
+
+        # host-wide sources (e.g. the job table) are not polled per process
+        if not include_shared and shared and not counter_names:
+            continue
+
+        try:
+            values = collect()
+        except Exception:
+            # a failing source must not break the whole scrape
+            continue
+
+        for name, value in values.items():
+
+            metric = f"ithrive_{prefix}_{name}"
+
+            if name in counter_names:
+                counters[metric + "_total"] = value
+            elif name in shared:
+                shared_values[metric] = value
+            else:
+                gauges[metric] = value
+
+    return counters, gauges, shared_values
+
+
+# ------------------------------------------------
+# PROCESS SNAPSHOTS
+# ------------------------------------------------
+def snapshot():
+
+    with _lock:
+        histograms = {k: dict(v, buckets=list(v["buckets"])) for k, v in _histograms.items()}
+
+    counters, gauges, _ = collect_gauges(include_shared=False)
+
+    return {
+        "histograms": histograms,
+        "counters": counters,
+        "gauges": gauges
+    }
+
+
+def write_json(directory, name, data):
+
+    # write then rename so a scrape never reads a partial file
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+
+        os.replace(tmp, os.path.join(directory, name))
+
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def flush():
+
+    global _snapshot_name, _last_snapshot
+
+    if not METRICS_DIR:
+        return
+
+    data = snapshot()
+
+    if data == _last_snapshot:
+        return
+
+    # pid for the liveness check, plus a token so a reused pid never
+    # overwrites an exited process's totals
+    if _snapshot_name is None or not _snapshot_name.startswith(f"{os.getpid()}."):
+        _snapshot_name = f"{os.getpid()}.{uuid.uuid4().hex[:8]}.json"
+
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        write_json(METRICS_DIR, _snapshot_name, data)
+    except OSError:
+        return
+
+    _last_snapshot = data
+
+
+def flusher_loop():
+
+    while True:
+
+        time.sleep(METRICS_FLUSH_SECONDS)
+
+        try:
+            flush()
+        except Exception:
+            pass
+
+
+def ensure_flusher():
+
+    global _flusher_pid, _snapshot_name, _last_snapshot
+
+    # threads do not survive fork, so each process starts its own
+    if not METRICS_DIR or _flusher_pid == os.getpid():
+        return
+
+    with _lock:
+
+        if _flusher_pid == os.getpid():
+            return
+
+        # a forked child starts from its parent's counts; only the
+        # parent's snapshot reports those
+        if _flusher_pid is not None:
+            for hist in _histograms.values():
+                hist["buckets"] = [0] * len(BUCKETS)
+                hist["count"] = 0
+                hist["sum"] = 0.0
+
+        _snapshot_name = None
+        _last_snapshot = None
+
+        threading.Thread(target=flusher_loop, name="metrics-flush", daemon=True).start()
+
+        _flusher_pid = os.getpid()
+
+
+def register_exit_flush():
+
+    global _exit_flush
+
+    if not _exit_flush:
+        atexit.register(flush)
+        _exit_flush = True
+
+
+def enable_directory():
+
+    global METRICS_DIR
+
+    METRICS_DIR = METRICS_DIR or DEFAULT_METRICS_DIR
+
+    # exported so batch pool children, which import this module afresh,
+    # write their snapshots to the same place
+    os.environ["METRICS_DIR"] = METRICS_DIR
+
+    register_exit_flush()
+
+
+if METRICS_DIR:
+    register_exit_flush()
+
+
+def reset_directory():
+
+    # called once at server start, before any worker exists
+    if not METRICS_DIR:
+        return
+
+    try:
+        names = os.listdir(METRICS_DIR)
+    except OSError:
+        return
+
+    for name in names:
+        try:
+            os.remove(os.path.join(METRICS_DIR, name))
+        except OSError:
+            pass
+
+
+# ------------------------------------------------
+# AGGREGATION
+# ------------------------------------------------
+def pid_alive(pid):
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    return True
+
+
+def read_json(path):
+
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def empty_totals():
+
+    return {"histograms": {}, "counters": {}}
+
+
+def add_totals(totals, data):
+
+    for stage, hist in data.get("histograms", {}).items():
+
+        total = totals["histograms"].setdefault(stage, {
+            "buckets": [0] * len(BUCKETS),
+            "count": 0,
+            "sum": 0.0
+        })
+
+        total["buckets"] = [a + b for a, b in zip(total["buckets"], hist["buckets"])]
+        total["count"] += hist["count"]
+        total["sum"] += hist["sum"]
+
+    for metric, value in data.get("counters", {}).items():
+        totals["counters"][metric] = totals["counters"].get(metric, 0) + value
+
+
+def fold_exited():
+
+    # move snapshots of exited processes into the archive, under a file
+    # lock so two scrapes cannot fold the same process twice
+    lock_path = os.path.join(METRICS_DIR, LOCK_FILE)
+
+    with open(lock_path, "a") as lock:
+
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        archive_path = os.path.join(METRICS_DIR, ARCHIVE_FILE)
+
+        archive = read_json(archive_path) or empty_totals()
+
+        exited = []
+
+        for name in os.listdir(METRICS_DIR):
+
+            parts = name.split(".")
+
+            if len(parts) != 3 or parts[2] != "json" or not parts[0].isdigit():
+                continue
+
+            if pid_alive(int(parts[0])):
+                continue
+
+            data = read_json(os.path.join(METRICS_DIR, name))
+
+            if data is not None:
+                add_totals(archive, data)
+
+            exited.append(name)
+
+        if exited:
+
+            write_json(METRICS_DIR, ARCHIVE_FILE, archive)
+
+            for name in exited:
+                try:
+                    os.remove(os.path.join(METRICS_DIR, name))
+                except OSError:
+                    pass
+
+
+def aggregate():
+
+    # (histograms, counters, gauges) over every process on the host
+    flush()
+
+    try:
+        fold_exited()
+        names = os.listdir(METRICS_DIR)
+    except OSError:
+        names = []
+
+    totals = empty_totals()
+    gauges = {}
+
+    archive = read_json(os.path.join(METRICS_DIR, ARCHIVE_FILE))
+
+    if archive is not None:
+        add_totals(totals, archive)
+
+    for name in names:
+
+        if not name.endswith(".json") or name == ARCHIVE_FILE:
+            continue
+
+        data = read_json(os.path.join(METRICS_DIR, name))
+
+        if data is None:
+            continue
+
+        add_totals(totals, data)
+
+        for metric, value in data.get("gauges", {}).items():
+            gauges[metric] = gauges.get(metric, 0) + value
+
+    return totals["histograms"], totals["counters"], gauges
+
+
+# ------------------------------------------------
+# PROMETHEUS TEXT FORMAT
+# ------------------------------------------------
+def format_value(v):
+
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def render_prometheus():
+
+    if METRICS_DIR:
+        histograms, counters, gauges = aggregate()
+        _, _, shared = collect_gauges(include_shared=True)
+    else:
+        data = snapshot()
+        histograms = data["histograms"]
+        counters, gauges, shared = collect_gauges(include_shared=True)
+
+    lines = [
+        f"# HELP {STAGE_METRIC} Time spent per parsing stage.",
+        f"# TYPE {STAGE_METRIC} histogram"
+    ]
+
+    for stage in sorted(histograms):
+
+        hist = histograms[stage]
+
+        cumulative = 0
+
+        for bound, count in zip(BUCKETS, hist["buckets"]):
+            cumulative += count
+            lines.append(
+                f'{STAGE_METRIC}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}'
+            )
+
+        lines.append(f'{STAGE_METRIC}_bucket{{stage="{stage}",le="+Inf"}} {hist["count"]}')
+        lines.append(f'{STAGE_METRIC}_sum{{stage="{stage}"}} {format_value(hist["sum"])}')
+        lines.append(f'{STAGE_METRIC}_count{{stage="{stage}"}} {hist["count"]}')
+
+    for metric in sorted(counters):
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {format_value(counters[metric])}")
+
+    gauges = dict(gauges, **shared)
+
+    for metric in sorted(gauges):
+        lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"{metric} {format_value(gauges[metric])}")
+
+    return "\n".join(lines) + "\n"
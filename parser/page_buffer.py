@@ -0,0 +1,86 @@
+import cv2
+import numpy as np
+
+# Plain arrays follow the OpenCV convention
+DEFAULT_ORDER = "BGR"
+
+CONVERSIONS = {
+    ("RGB", "HSV"): cv2.COLOR_RGB2HSV,
+    ("BGR", "HSV"): cv2.COLOR_BGR2HSV,
+    ("RGB", "GRAY"): cv2.COLOR_RGB2GRAY,
+    ("BGR", "GRAY"): cv2.COLOR_BGR2GRAY,
+    ("RGB", "BGR"): cv2.COLOR_RGB2BGR,
+    ("BGR", "RGB"): cv2.COLOR_BGR2RGB
+}
+
+
+# ------------------------------------------------
+# PAGE BUFFER
+# ------------------------------------------------
+class PageBuffer(np.ndarray):
+
+    # Renderer output that remembers its channel order. Wrapping is a
+    # view, never a copy; slices, reshapes and arithmetic results carry
+    # the order along.
+
+    def __new__(cls, pixels, order=DEFAULT_ORDER):
+
+        buf = np.asarray(pixels).view(cls)
+        buf.order = order
+
+        return buf
+
+    def __array_finalize__(self, obj):
+
+        self.order = getattr(obj, "order", DEFAULT_ORDER)
+
+
+def channel_order(img):
+
+    return getattr(img, "order", DEFAULT_ORDER)
+
+
+def crop(img, y1, y2, x1, x2):
+
+    # read-only view: a crop can never write back into the shared page
+    view = img[y1:y2, x1:x2]
+    view.flags.writeable = False
+
+    return view
+
+
+# ------------------------------------------------
+# COLOUR CONVERSION
+# ------------------------------------------------
+def convert(img, target):
+
+    order = channel_order(img)
+
+    if order == target:
+        return img
+
+    out = cv2.cvtColor(np.asarray(img), CONVERSIONS[(order, target)])
+
+    if target in ("RGB", "BGR"):
+        return PageBuffer(out, target)
+
+    return out
+
+
+def to_hsv(img):
+
+    return convert(img, "HSV")
+
+
+def to_gray(img):
+
+    if img.ndim == 2:
+        return img
+
+    return convert(img, "GRAY")
+
+
+def to_bgr(img):
+
+    # for OpenCV drawing and encoding; a copy only when channels differ
+    return convert(img, "BGR")
@@ -0,0 +1,294 @@
+import contextvars
+import importlib.util
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+
+from contextlib import contextmanager
+
+import numpy as np
+from pdf2image import convert_from_bytes
+
+from parser.page_buffer import PageBuffer
+
+RENDER_DPI = 200
+
+# "poppler" (pdftoppm subprocess), "pymupdf" (in-process, optional
+# dependency) or "auto" for pymupdf when it is installed
+RASTERIZER = os.environ.get("RASTERIZER", "auto")
+
+# Backend forced for the current context, e.g. by parse_document's page
+# threads; None uses RASTERIZER
+_rasterizer_override = contextvars.ContextVar("rasterizer_override", default=None)
+
+# Page holding the disease screening table in a standard Bio Scan export.
+# Set SCORE_PAGE=auto to locate it from the page text instead.
+SCORE_PAGE_INDEX = 1
+
+SCORE_PAGE = os.environ.get("SCORE_PAGE", str(SCORE_PAGE_INDEX))
+
+SCORE_PAGE_MARKERS = [
+    "diseases and disorder",
+    "disease screening score"
+]
+
+
+# ------------------------------------------------
+# LOCATE SCORE PAGE
+# ------------------------------------------------
+def find_score_page(pdf_bytes):
+
+    import pdfplumber
+
+    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+
+        for i, page in enumerate(pdf.pages):
+
+            text = (page.extract_text() or "").lower()
+
+            for marker in SCORE_PAGE_MARKERS:
+                if marker in text:
+                    return i
+
+    return None
+
+
+def resolve_score_page(pdf_bytes, page=None):
+
+    if page is None:
+        page = SCORE_PAGE
+
+    if page != "auto":
+        return int(page)
+
+    index = find_score_page(pdf_bytes)
+
+    if index is None:
+        return SCORE_PAGE_INDEX
+
+    return index
+
+
+# ------------------------------------------------
+# CLIP GEOMETRY
+# ------------------------------------------------
+def points_to_pixels(clip, dpi):
+
+    scale = dpi / 72
+
+    return [int(round(v * scale)) for v in clip]
+
+
+# ------------------------------------------------
+# POPPLER (pdftoppm subprocess)
+# ------------------------------------------------
+def read_ppm(data):
+
+    # binary PPM: "P6 <width> <height> <maxval>" followed by one whitespace byte
+    fields = []
+    pos = 0
+
+    while len(fields) < 4:
+
+        if pos >= len(data):
+            raise ValueError("pdftoppm returned a truncated image")
+
+        while data[pos:pos+1].isspace():
+            pos += 1
+
+        if data[pos:pos+1] == b"#":
+            pos = data.index(b"\n", pos) + 1
+            continue
+
+        end = pos
+        while end < len(data) and not data[end:end+1].isspace():
+            end += 1
+
+        fields.append(data[pos:end])
+        pos = end
+
+    if fields[0] != b"P6":
+        raise ValueError("pdftoppm returned unexpected image format")
+
+    width, height = int(fields[1]), int(fields[2])
+
+    pixels = np.frombuffer(data, dtype=np.uint8, count=width*height*3, offset=pos+1)
+
+    return pixels.reshape(height, width, 3)
+
+
+def poppler_page(pdf_bytes, index, dpi=RENDER_DPI):
+
+    # pdftoppm page numbers are 1-based
+    images = convert_from_bytes(
+        pdf_bytes,
+        dpi=dpi,
+        first_page=index + 1,
+        last_page=index + 1
+    )
+
+    if not images:
+        raise ValueError(f"PDF has no page {index}")
+
+    return PageBuffer(images[0], "RGB")
+
+
+def poppler_clip(pdf_bytes, index, clip, dpi=RENDER_DPI):
+
+    x, y, w, h = points_to_pixels(clip, dpi)
+
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as f:
+
+        f.write(pdf_bytes)
+        f.flush()
+
+        out = subprocess.run(
+            [
+                "pdftoppm",
+                "-f", str(index + 1),
+                "-l", str(index + 1),
+                "-r", str(dpi),
+                "-x", str(x),
+                "-y", str(y),
+                "-W", str(w),
+                "-H", str(h),
+                f.name
+            ],
+            check=True,
+            capture_output=True
+        )
+
+    if not out.stdout:
+        raise ValueError(f"PDF has no page {index}")
+
+    return PageBuffer(read_ppm(out.stdout), "RGB")
+
+
+# ------------------------------------------------
+# PYMUPDF (in process)
+# ------------------------------------------------
+# MuPDF is not thread-safe; concurrent renders take turns on this
+# backend, so parse_document's page threads use poppler when installed
+_pymupdf_lock = threading.Lock()
+
+
+def pymupdf_render(pdf_bytes, index, clip, dpi):
+
+    import pymupdf
+
+    scale = dpi / 72
+
+    with _pymupdf_lock, pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+
+        if not 0 <= index < doc.page_count:
+            raise ValueError(f"PDF has no page {index}")
+
+        page = doc[index]
+
+        rect = None
+
+        if clip is not None:
+            # the same pixel grid pdftoppm -x/-y/-W/-H would cut
+            x, y, w, h = points_to_pixels(clip, dpi)
+            rect = pymupdf.Rect(x, y, x + w, y + h) / scale
+
+        pix = page.get_pixmap(
+            matrix=pymupdf.Matrix(scale, scale),
+            clip=rect,
+            colorspace=pymupdf.csRGB,
+            alpha=False
+        )
+
+        # samples is one C-level copy out of the pixmap, straight into
+        # the array's buffer
+        pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(
+            pix.height, pix.width, pix.n
+        )
+
+        return PageBuffer(pixels, "RGB")
+
+
+def pymupdf_page(pdf_bytes, index, dpi=RENDER_DPI):
+
+    return pymupdf_render(pdf_bytes, index, None, dpi)
+
+
+def pymupdf_clip(pdf_bytes, index, clip, dpi=RENDER_DPI):
+
+    return pymupdf_render(pdf_bytes, index, clip, dpi)
+
+
+# ------------------------------------------------
+# RASTERIZER SELECTION
+# ------------------------------------------------
+RASTERIZERS = {
+    "poppler": (poppler_page, poppler_clip),
+    "pymupdf": (pymupdf_page, pymupdf_clip)
+}
+
+
+def pymupdf_available():
+
+    return importlib.util.find_spec("pymupdf") is not None
+
+
+def poppler_available():
+
+    return shutil.which("pdftoppm") is not None
+
+
+def get_rasterizer(name=None):
+
+    # (render_page, render_clip) pair for a backend name
+    name = name or _rasterizer_override.get() or RASTERIZER
+
+    if name == "auto":
+        name = "pymupdf" if pymupdf_available() else "poppler"
+
+    if name not in RASTERIZERS:
+        raise ValueError(f"unknown rasterizer {name!r}")
+
+    return RASTERIZERS[name]
+
+
+@contextmanager
+def use_rasterizer(name):
+
+    token = _rasterizer_override.set(name)
+
+    try:
+        yield
+    finally:
+        _rasterizer_override.reset(token)
+
+
+# ------------------------------------------------
+# RENDER PAGE / CLIP REGION
+# ------------------------------------------------
+def render_page(pdf_bytes, index, dpi=RENDER_DPI, rasterizer=None):
+
+    return get_rasterizer(rasterizer)[0](pdf_bytes, index, dpi=dpi)
+
+
+def render_score_page(pdf_bytes, page=None, dpi=RENDER_DPI, rasterizer=None):
+
+    index = resolve_score_page(pdf_bytes, page)
+
+    return render_page(pdf_bytes, index, dpi=dpi, rasterizer=rasterizer)
+
+
+def render_clip(pdf_bytes, index, clip, dpi=RENDER_DPI, rasterizer=None):
+
+    # clip is (x, y, width, height) in PDF points, so it means the same
+    # region of the page at every dpi
+    return get_rasterizer(rasterizer)[1](pdf_bytes, index, clip, dpi=dpi)
+
+
+def render_score_clip(pdf_bytes, clip, page=None, dpi=RENDER_DPI, rasterizer=None):
+
+    index = resolve_score_page(pdf_bytes, page)
+
+    return render_clip(pdf_bytes, index, clip, dpi=dpi, rasterizer=rasterizer)
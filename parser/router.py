@@ -1,28 +1,141 @@
-import hashlib
+import os
+
 import cv2
+import numpy as np
+
+from parser.page_buffer import to_gray
+
+# dHash grid: HASH_SIZE x HASH_SIZE horizontal gradient bits
+HASH_SIZE = 16
+HASH_BITS = HASH_SIZE * HASH_SIZE
+
+# Largest Hamming distance still treated as the same template
+LAYOUT_MAX_DISTANCE = int(os.environ.get("LAYOUT_MAX_DISTANCE", 24))
+
+# layout name -> dHash (hex) of its score page
+KNOWN_LAYOUTS = {
+    "bio_scan_v1": "05462eda2ed22ad21af200000000000026d626d22eda3af61e1a000000000000"
+}
+
+LAYOUT_PARSERS = {
+    "bio_scan_v1": "HSV"
+}
+
+
+# ------------------------------------------------
+# PERCEPTUAL HASH
+# ------------------------------------------------
+def dhash(page, size=HASH_SIZE):
+
+    # sign of the horizontal gradient on a tiny blurred thumbnail: stable
+    # under noise, compression, exposure and small shifts
+    gray = to_gray(page)
+
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+
+    bits = np.packbits(small[:, 1:] > small[:, :-1])
+
+    return int.from_bytes(bits.tobytes(), "big")
 
 
 def compute_layout_hash(page):
 
-    small = cv2.resize(page, (200, 200))
+    return f"{dhash(page):0{HASH_BITS // 4}x}"
 
-    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
 
-    pixel_bytes = gray.tobytes()
+def hamming(a, b):
 
-    layout_hash = hashlib.sha256(pixel_bytes).hexdigest()
+    return (a ^ b).bit_count()
 
-    return layout_hash
 
+# ------------------------------------------------
+# MULTI-INDEX HASHING
+# ------------------------------------------------
+class HashIndex:
 
-def choose_parser(page):
+    # Split each hash into max_distance + 1 chunks. Two hashes within
+    # max_distance must agree exactly on at least one chunk, so exact
+    # chunk lookups give every candidate and only those are compared.
+
+    def __init__(self, bits=HASH_BITS, max_distance=LAYOUT_MAX_DISTANCE):
+
+        self.max_distance = max_distance
+
+        chunks = max_distance + 1
+        edges = [round(i * bits / chunks) for i in range(chunks + 1)]
+
+        self.chunks = [(lo, (1 << (hi - lo)) - 1) for lo, hi in zip(edges, edges[1:])]
+        self.tables = [{} for _ in self.chunks]
+
+        self.size = 0
+
+    def keys(self, value):
+
+        return [(value >> shift) & mask for shift, mask in self.chunks]
+
+    def add(self, value, name):
+
+        entry = (value, name)
+
+        for table, key in zip(self.tables, self.keys(value)):
+            table.setdefault(key, []).append(entry)
+
+        self.size += 1
 
-    layout_hash = compute_layout_hash(page)
+    def nearest(self, value):
+
+        best = None
+        best_distance = self.max_distance + 1
+
+        seen = set()
+
+        for table, key in zip(self.tables, self.keys(value)):
+
+            for entry in table.get(key, ()):
+
+                if entry in seen:
+                    continue
+
+                seen.add(entry)
+
+                d = hamming(value, entry[0])
+
+                if d < best_distance:
+                    best, best_distance = entry[1], d
+
+        if best is None:
+            return None
+
+        return best, best_distance
+
+
+layout_index = HashIndex()
+
+
+def register_layout_hash(name, layout_hash):
+
+    layout_index.add(int(layout_hash, 16), name)
+
+
+for _name, _hash in KNOWN_LAYOUTS.items():
+    register_layout_hash(_name, _hash)
+
+
+# ------------------------------------------------
+# ROUTING
+# ------------------------------------------------
+def match_layout(page):
+
+    # (layout name, distance) of the nearest known template within
+    # LAYOUT_MAX_DISTANCE, or None
+    return layout_index.nearest(dhash(page))
+
+
+def choose_parser(page):
 
-    # known layout (your current working report)
-    KNOWN_LAYOUT = "YlLY455AeeVlZXU8xGy1yd04QIomu+5OyCOaFw+8oHg="
+    match = match_layout(page)
 
-    if layout_hash.startswith(KNOWN_LAYOUT[:10]):
-        return "HSV"
+    if match is None:
+        return "SEMANTIC"
 
-    return "SEMANTIC"
\ No newline at end of file
+    return LAYOUT_PARSERS.get(match[0], "SEMANTIC")
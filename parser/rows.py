@@ -1,10 +1,91 @@
 import cv2
 import numpy as np
 
+from parser.page_buffer import to_gray
+
+# Label column searched for row separators: this many pixels left of the
+# risk bar anchor, stopping short of the bar itself
+LABEL_BAND = 200
+LABEL_GAP = 10
+
+# A profile row darker than this fraction of the typical cell level is
+# part of a separator line between table rows
+SEPARATOR_RATIO = 0.8
+
+# Rows brighter than this are page background, not table cells
+BACKGROUND_LEVEL = 200
+
+# Pixel height a table row must have, between its separators
+ROW_MIN_HEIGHT = 15
+ROW_MAX_HEIGHT = 60
+
+
+# ------------------------------------------------
+# PROJECTION PROFILE
+# ------------------------------------------------
+def row_profile(img, anchors):
+
+    # mean gray level per image row across the label column
+    x2 = max(1, anchors["risk_bar_x"] - LABEL_GAP)
+    x1 = max(0, x2 - LABEL_BAND)
+
+    band = to_gray(img[:, x1:x2])
+
+    return np.asarray(band).mean(axis=1)
+
+
+def separator_spans(profile):
+
+    # (start, end) of each run of separator rows
+    cells = profile[profile < BACKGROUND_LEVEL]
+
+    if not len(cells):
+        return np.empty((0, 2), np.int64)
+
+    dark = profile < np.median(cells) * SEPARATOR_RATIO
+
+    edges = np.diff(dark.astype(np.int8), prepend=0, append=0)
+
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    return np.stack([starts, ends], axis=1)
+
+
+def locate_rows(img, anchors):
+
+    # table rows as (centres, heights): the spans between consecutive
+    # separator lines that have a plausible row height
+    spans = separator_spans(row_profile(img, anchors))
+
+    tops = spans[:-1, 1]
+    bottoms = spans[1:, 0]
+
+    heights = bottoms - tops
+
+    keep = (heights >= ROW_MIN_HEIGHT) & (heights <= ROW_MAX_HEIGHT)
+
+    tops = tops[keep]
+    heights = heights[keep]
+
+    centres = tops + heights / 2
+
+    return centres.tolist(), heights.tolist()
+
 
 def detect_rows(img, anchors):
 
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    centres, _ = locate_rows(img, anchors)
+
+    return [int(round(c)) for c in centres]
+
+
+# ------------------------------------------------
+# HOUGH LINES (previous detector)
+# ------------------------------------------------
+def detect_rows_hough(img, anchors):
+
+    gray = to_gray(img)
 
     edges = cv2.Canny(gray, 50, 150)
 
@@ -41,4 +122,4 @@ def detect_rows(img, anchors):
         elif abs(y - filtered[-1]) > min_spacing:
             filtered.append(y)
 
-    return filtered
\ No newline at end of file
+    return filtered
@@ -0,0 +1,182 @@
+import io
+
+import numpy as np
+import pdfplumber
+from pdfminer.layout import LTCurve, LTFigure
+
+from parser.extract import (
+    BAR_CLIP,
+    DISEASES,
+    REFERENCE_DPI,
+    ROW_MAX_HEIGHT,
+    ROW_MIN_HEIGHT,
+    ROW_MIN_SPACING,
+    classify_samples
+)
+from parser.page_buffer import PageBuffer, to_hsv
+from parser.render import resolve_score_page
+
+ENGINE_NAME = "v2_vector_full_table"
+
+# Page units (points) to pixels on the dpi=200 grid the raster limits use
+PX_PER_PT = REFERENCE_DPI / 72
+
+
+# ------------------------------------------------
+# FILL COLOR TO PIXEL
+# ------------------------------------------------
+def fill_to_rgb(color):
+
+    if color is None or isinstance(color, str):
+        return None
+
+    color = list(color)
+
+    if len(color) == 1:
+        color = color * 3
+
+    elif len(color) == 4:
+        c, m, y, k = color
+        color = [(1-c)*(1-k), (1-m)*(1-k), (1-y)*(1-k)]
+
+    elif len(color) != 3:
+        return None
+
+    try:
+        return [int(round(float(v) * 255)) for v in color]
+    except (TypeError, ValueError):
+        return None
+
+
+# ------------------------------------------------
+# FILLED RECTS IN BAR COLUMN
+# ------------------------------------------------
+def iter_shapes(container):
+
+    # rects and closed paths in content (= paint) order, including
+    # those nested in form XObjects
+    for obj in container:
+
+        if isinstance(obj, LTFigure):
+            yield from iter_shapes(obj)
+
+        elif isinstance(obj, LTCurve):
+            yield obj
+
+
+def bar_rects(page):
+
+    x, y, w, h = BAR_CLIP
+
+    mid_x = x + w / 2
+
+    rects = []
+
+    for shape in iter_shapes(page.layout):
+
+        if not shape.fill:
+            continue
+
+        # pdfminer boxes are bottom-up, the raster grid is top-down
+        top = page.height - shape.y1
+        bottom = page.height - shape.y0
+
+        # must cover the sampled column and sit inside the scan range
+        if not (shape.x0 <= mid_x <= shape.x1):
+            continue
+
+        if bottom < y or top > y + h:
+            continue
+
+        rgb = fill_to_rgb(shape.non_stroking_color)
+
+        if rgb is None:
+            continue
+
+        rects.append((top, bottom, rgb))
+
+    return rects
+
+
+# ------------------------------------------------
+# RECTS TO ROWS
+# ------------------------------------------------
+def detect_vector_rows(rects):
+
+    rows = []
+
+    for seq, (top, bottom, rgb) in enumerate(rects):
+
+        y1 = int(round(top * PX_PER_PT))
+        y2 = int(round(bottom * PX_PER_PT))
+
+        if not ROW_MIN_HEIGHT < (y2-y1) < ROW_MAX_HEIGHT:
+            continue
+
+        rows.append((y1, y2, rgb, seq))
+
+    rows.sort(key=lambda r: r[0])
+
+    # merge rects of the same bar with the raster engine's spacing rule;
+    # content order is paint order, so the last painted fill is visible
+    filtered = []
+
+    for r in rows:
+
+        if filtered and r[0] - filtered[-1][0] <= ROW_MIN_SPACING:
+            if r[3] > filtered[-1][3]:
+                filtered[-1] = (filtered[-1][0], filtered[-1][1], r[2], r[3])
+            continue
+
+        filtered.append(r)
+
+    return [(y1, y2, rgb) for y1, y2, rgb, _ in filtered]
+
+
+def classify_fills(rows):
+
+    if not rows:
+        return []
+
+    # same conversion the raster path applies to rendered pixels
+    pixels = PageBuffer(np.array([[rgb] for _, _, rgb in rows], dtype=np.uint8), "RGB")
+
+    hsv = to_hsv(pixels).reshape(-1, 3)
+
+    return list(classify_samples(hsv.astype(float)))
+
+
+# ------------------------------------------------
+# MAIN PARSER
+# ------------------------------------------------
+def parse_vector_report(pdf_bytes, page=None):
+
+    index = resolve_score_page(pdf_bytes, page)
+
+    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+
+        if index >= len(pdf.pages):
+            return None
+
+        rects = bar_rects(pdf.pages[index])
+
+    rows = detect_vector_rows(rects)
+
+    # no vector bars on this page (e.g. a scanned report)
+    if not rows:
+        return None
+
+    labels = classify_fills(rows)[:len(DISEASES)]
+
+    # only a full table of coloured bars is trusted; vector tracks over a
+    # raster bar image, a few bars drawn as vectors or a table continued
+    # from another page go to the raster engine
+    if len(labels) < len(DISEASES) or any(label is None for label in labels):
+        return None
+
+    scores = dict(zip(DISEASES, labels))
+
+    return {
+        "engine": ENGINE_NAME,
+        "scores": scores
+    }